@@ -1 +1,8 @@
-from llimcobe.llimcobe import Llimcobe as LCB
\ No newline at end of file
+from llimcobe.llimcobe import Llimcobe as LCB
+from llimcobe.dataset import Dataset, NpyDataset, MemmapDataset
+from llimcobe.scratch import ScratchSpace
+from llimcobe.results import BenchmarkResults
+from llimcobe.cache import ResultCache
+from llimcobe.verify import Verification, compare_arrays, default_compare
+from llimcobe.scaling import ScalingResults
+from llimcobe.tiling import TiledDataset
@@ -0,0 +1,3 @@
+from llimcobe.cli import main
+
+main()
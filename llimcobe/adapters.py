@@ -0,0 +1,204 @@
+import bz2
+import importlib
+import io
+import lzma
+import platform
+import struct
+import zlib
+import numpy as np
+
+# Header of the raw buffer codecs, little-endian: the length of the dtype string, the number of dimensions,
+# then the dtype string and a uint32 per dimension.
+HEADER = struct.Struct("<BB")
+
+
+def write(target, data):
+    """
+    This function will write a compressed bitstream into a path or a BytesIO buffer.
+    :param target: The path or the BytesIO buffer.
+    :param data: A bytes-like object with the bitstream.
+    """
+    if isinstance(target, io.IOBase):
+        target.write(data)
+    else:
+        with open(target, "wb") as fo:
+            fo.write(data)
+
+
+def read(target) -> bytes:
+    """
+    This function will read a compressed bitstream from a path or a BytesIO buffer.
+    :param target: The path or the BytesIO buffer.
+    :return: The bitstream.
+    """
+    if isinstance(target, io.IOBase):
+        return target.read()
+    with open(target, "rb") as fo:
+        return fo.read()
+
+
+def raw_header(image: np.ndarray) -> bytes:
+    """
+    :param image: The image.
+    :return: The header with the dtype and the shape of the image.
+    """
+    dtype = image.dtype.str.encode()
+    return HEADER.pack(len(dtype), image.ndim) + dtype + struct.pack("<{}I".format(image.ndim), *image.shape)
+
+
+def split_raw_header(data: bytes):
+    """
+    :param data: The bitstream of a raw buffer codec.
+    :return: A tuple with the dtype, the shape and the compressed payload.
+    """
+    dtype_length, ndim = HEADER.unpack_from(data)
+    start = HEADER.size
+    dtype = np.dtype(data[start:start + dtype_length].decode())
+    start += dtype_length
+    shape = struct.unpack_from("<{}I".format(ndim), data, start)
+    return dtype, shape, memoryview(data)[start + 4 * ndim:]
+
+
+def zstd_module():
+    """
+    :return: The zstd module of the standard library (Python 3.14+) or the zstandard package.
+    """
+    try:
+        return importlib.import_module("compression.zstd")
+    except ImportError:
+        return importlib.import_module("zstandard")
+
+
+def buffer_codec(name: str, level: int = None) -> dict:
+    """
+    This function will build a model over the raw buffer of the images with a general-purpose compressor.
+    The compressor reads the ndarray buffer in place, and a small header keeps the dtype and the shape.
+    :param name: "zlib", "lzma", "bz2" or "zstd". zstd needs Python 3.14 or the zstandard package.
+    :param level: The compression level, or the lzma preset. Leave it empty to use the default one.
+    :return: A dictionary with the set_model parameters, except name.
+    """
+    # The library version is part of the model version, so cached results and stored bitstreams of other versions
+    # aren't reused. lzma and bz2 don't expose theirs, so the version of the Python build they come with is used.
+    if name == "zlib":
+        compress = lambda buffer: zlib.compress(buffer, -1 if level is None else level)
+        decompress = zlib.decompress
+        library = zlib.ZLIB_RUNTIME_VERSION
+    elif name == "lzma":
+        compress = lambda buffer: lzma.compress(buffer, preset=level)
+        decompress = lzma.decompress
+        library = "Python-" + platform.python_version()
+    elif name == "bz2":
+        compress = lambda buffer: bz2.compress(buffer, 9 if level is None else level)
+        decompress = bz2.decompress
+        library = "Python-" + platform.python_version()
+    elif name == "zstd":
+        zstd = zstd_module()
+        compress = lambda buffer: zstd.compress(buffer, **({} if level is None else {"level": level}))
+        decompress = zstd.decompress
+        library = "{}-{}".format(getattr(zstd, "zstd_version", None) or
+                                 ".".join(map(str, getattr(zstd, "ZSTD_VERSION", ()))),
+                                 getattr(zstd, "__version__", "stdlib"))
+    else:
+        raise ValueError("Unknown buffer codec: {}".format(name))
+
+    def save(image, target):
+        image = np.ascontiguousarray(image)
+        write(target, raw_header(image) + compress(memoryview(image).cast("B")))
+
+    def load(target):
+        dtype, shape, payload = split_raw_header(read(target))
+        return np.frombuffer(decompress(payload), dtype=dtype).reshape(shape)
+
+    return {"model": None, "preprocess": np.asarray, "save": save, "load": load, "compare": None,
+            "version": "{}-{}-{}".format(name, library, level)}
+
+
+# PIL modes of the ndarray layouts, by dtype and number of channels. 0 channels is an HxW image.
+PIL_MODES = {("|u1", 0): "L", ("|u1", 3): "RGB", ("|u1", 4): "RGBA", ("<u2", 0): "I;16", ("<i4", 0): "I",
+             ("<f4", 0): "F"}
+# PIL save options of lossless compression for every format.
+PIL_LOSSLESS = {"PNG": {}, "WEBP": {"lossless": True, "quality": 100, "exact": True},
+                "TIFF": {"compression": "tiff_adobe_deflate"}}
+
+
+def squeeze(image):
+    """
+    This function will drop the channel axis of single-channel images, without copying them.
+    :param image: The image in HxWxC numpy.ndarray format.
+    :return: The image in HxW format if it has a single channel, otherwise the image.
+    """
+    image = np.asarray(image)
+    return image[..., 0] if image.ndim == 3 and image.shape[2] == 1 else image
+
+
+def pil_codec(image_format: str, **options) -> dict:
+    """
+    This function will build a model with a lossless format of PIL.
+    The PIL image is built with Image.frombuffer over the ndarray buffer, which shares it for the L, RGBA, I;16,
+    I and F modes instead of copying it like Image.fromarray, and the bitstream is saved straight into the target.
+    :param image_format: "PNG", "WEBP" or "TIFF", or any other format PIL can save losslessly. WebP only stores
+                         8-bit RGB and RGBA images, so the rest are reported as mismatches.
+    :param options: The save options of the format, added to the lossless ones.
+    :return: A dictionary with the set_model parameters, except name.
+    """
+    from PIL import Image, __version__
+
+    image_format = image_format.upper()
+    save_options = dict(PIL_LOSSLESS.get(image_format, {}), **options)
+
+    def save(image, target):
+        image = np.ascontiguousarray(image)
+        channels = image.shape[2] if image.ndim == 3 else 0
+        mode = PIL_MODES.get((image.dtype.str, channels))
+        if mode is None:
+            raise ValueError("{} images of shape {} can't be saved with PIL".format(image.dtype, image.shape))
+        pil_image = Image.frombuffer(mode, (image.shape[1], image.shape[0]), image, "raw", mode, 0, 1)
+        pil_image.save(target, format=image_format, **save_options)
+
+    def load(target):
+        with Image.open(target) as image:
+            return np.asarray(image)
+
+    return {"model": None, "preprocess": squeeze, "save": save, "load": load, "compare": None,
+            "version": "PIL-{}-{}-{}".format(__version__, image_format, sorted(save_options.items()))}
+
+
+def imagecodecs_codec(name: str, **options) -> dict:
+    """
+    This function will build a model with a codec of the imagecodecs package, e.g. "png", "webp", "jpegxl",
+    "jpegls" or "jpeg2k". The codec encodes the ndarray and returns the bitstream, which is saved straight into
+    the target.
+    :param name: The name of the codec, with an <name>_encode and an <name>_decode function in imagecodecs.
+    :param options: The options of the encode function, e.g. lossless=True or level.
+    :return: A dictionary with the set_model parameters, except name.
+    """
+    import imagecodecs
+
+    encode = getattr(imagecodecs, "{}_encode".format(name))
+    decode = getattr(imagecodecs, "{}_decode".format(name))
+
+    def save(image, target):
+        write(target, encode(image, **options))
+
+    def load(target):
+        return decode(read(target))
+
+    return {"model": None, "preprocess": squeeze, "save": save, "load": load, "compare": None,
+            "version": "imagecodecs-{}-{}-{}".format(imagecodecs.__version__, name, sorted(options.items()))}
+
+
+def adapter(name: str, **options) -> dict:
+    """
+    This function will build a built-in model by name.
+    :param name: "png", "webp" or "tiff" for PIL, "zlib", "lzma", "bz2" or "zstd" for the raw buffer codecs,
+                 or "imagecodecs:<codec>" for a codec of imagecodecs.
+    :param options: The options of the adapter.
+    :return: A dictionary with the set_model parameters, except name.
+    """
+    if name in ("png", "webp", "tiff"):
+        return pil_codec(name, **options)
+    if name in ("zlib", "lzma", "bz2", "zstd"):
+        return buffer_codec(name, **options)
+    if name.startswith("imagecodecs:"):
+        return imagecodecs_codec(name.partition(":")[2], **options)
+    raise ValueError("Unknown adapter: {}".format(name))
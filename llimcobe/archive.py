@@ -0,0 +1,54 @@
+import io
+import os
+import shutil
+from llimcobe.scratch import safe_name
+
+
+class Archive:
+    """
+    A class used to keep the compressed bitstreams of a benchmark in a directory, with a subdirectory per model and
+    a file per image index, so later runs can time the decompression without compressing the images again.
+    """
+    def __init__(self, directory: str):
+        """
+        :param directory: The archive directory. It is created if it doesn't exist.
+        """
+        self.directory = directory
+
+    def path(self, name: str, index: int) -> str:
+        """
+        :param name: The name of the model.
+        :param index: The index of the image.
+        :return: The path of the bitstream in the archive.
+        """
+        return os.path.join(self.directory, safe_name(name), str(index))
+
+    def store(self, name: str, index: int, source):
+        """
+        This function will copy a bitstream into the archive, replacing the previous one atomically.
+        :param name: The name of the model.
+        :param index: The index of the image.
+        :param source: The path or the BytesIO buffer the model saved the bitstream to.
+        """
+        path = self.path(name, index)
+        directory = os.path.dirname(path)
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        temp = "{}.{}.tmp".format(path, os.getpid())
+        if isinstance(source, io.BytesIO):
+            with open(temp, "wb") as fo:
+                fo.write(source.getbuffer())
+        else:
+            shutil.copyfile(source, temp)
+        os.replace(temp, path)
+
+    def find(self, name: str, index: int) -> str:
+        """
+        :param name: The name of the model.
+        :param index: The index of the image.
+        :return: The path of the bitstream in the archive.
+        """
+        path = self.path(name, index)
+        if not os.path.exists(path):
+            raise FileNotFoundError("The archive has no bitstream of the {} model for image {}".format(name, index))
+        return path
@@ -0,0 +1,107 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import numpy as np
+from llimcobe.results import FIELDS
+
+# The benchmark options that change what the timings measure, so results are only reused by runs with the same ones.
+TIMING_OPTIONS = ("in_memory", "warmup", "repeats", "resource_probes", "trace_allocations")
+
+
+def image_hash(image) -> str:
+    """
+    This function will hash the content of an image, including its shape and dtype.
+    :param image: The image in HxWxC numpy.ndarray format.
+    :return: The hexadecimal BLAKE2b digest of the image.
+    """
+    image = np.ascontiguousarray(image)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update("{}{}".format(image.shape, image.dtype.str).encode())
+    digest.update(memoryview(image).cast("B"))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    A class used to persist the results of (model, image) pairs in an SQLite database,
+    keyed by model name, model version, image content hash and the timing options of the benchmark.
+    """
+    def __init__(self, path: str, commit_every: int = 100, options: dict = None):
+        """
+        :param path: The path of the SQLite database. It is created if it doesn't exist.
+        :param commit_every: number of stored results between commits.
+        :param options: A dictionary with the benchmark options. Only results measured with the same TIMING_OPTIONS
+                        are reused.
+        """
+        self.path = path
+        self.commit_every = commit_every
+        self.pending = 0
+        options = options or {}
+        self.settings = json.dumps({option: options.get(option) for option in TIMING_OPTIONS}, sort_keys=True)
+        # The prefetch threads look results up while the main thread stores them, so the connection is shared.
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        # WAL lets the worker processes read the cache while the parent process writes to it.
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS results (model TEXT, version TEXT, image TEXT, "
+                                "settings TEXT, {}, PRIMARY KEY (model, version, image, settings))".format(
+                                    ", ".join(FIELDS)))
+        # Databases created before a field was added get the new column, with 0 for the existing rows.
+        # Their rows get empty settings, so they are never reused.
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(results)")}
+        if "settings" not in columns:
+            self.connection.execute("ALTER TABLE results ADD COLUMN settings TEXT DEFAULT ''")
+        for field in FIELDS:
+            if field not in columns:
+                self.connection.execute("ALTER TABLE results ADD COLUMN {} DEFAULT 0".format(field))
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get(self, name: str, version: str, key: str):
+        """
+        This function will look for the result of a (model, image) pair.
+        :param name: The name of the model.
+        :param version: The version of the model.
+        :param key: The content hash of the image.
+        :return: A dictionary with the result fields, or None if it isn't cached.
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT {} FROM results WHERE model = ? AND version = ? AND image = ? "
+                                          "AND settings = ?".format(", ".join(FIELDS)),
+                                          (name, version or "", key, self.settings)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(FIELDS, row))
+
+    def put(self, name: str, version: str, key: str, fields: dict):
+        """
+        This function will store the result of a (model, image) pair.
+        :param name: The name of the model.
+        :param version: The version of the model.
+        :param key: The content hash of the image.
+        :param fields: A dictionary with the result fields.
+        """
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO results (model, version, image, settings, {}) "
+                                    "VALUES (?, ?, ?, ?, {})".format(", ".join(FIELDS), ", ".join("?" * len(FIELDS))),
+                                    (name, version or "", key, self.settings, *(fields[field] for field in FIELDS)))
+            self.pending += 1
+        if self.pending >= self.commit_every:
+            self.commit()
+
+    def commit(self):
+        with self.lock:
+            self.connection.commit()
+            self.pending = 0
+
+    def close(self):
+        if self.connection is not None:
+            self.commit()
+            self.connection.close()
+            self.connection = None
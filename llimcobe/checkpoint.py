@@ -0,0 +1,68 @@
+import os
+import time
+import numpy as np
+from llimcobe.results import FIELDS, IMAGE_FIELDS
+
+
+class Checkpoint:
+    """
+    A class used to save the finished (model, image) results of a benchmark periodically,
+    so a killed run can be resumed without benchmarking them again.
+    """
+    def __init__(self, path: str, interval: float = 60.0):
+        """
+        :param path: The path of the checkpoint file, saved in NumPy .npz format.
+        :param interval: minimum number of seconds between two saves.
+        """
+        self.path = path
+        self.interval = interval
+        self.last_save = time.monotonic()
+
+    def load(self, results):
+        """
+        This function will restore into the results the finished rows of the checkpoint.
+        Rows of models or images that are not part of the results are ignored.
+        :param results: The BenchmarkResults to fill.
+        :return: The number of restored rows.
+        """
+        if not os.path.exists(self.path):
+            return 0
+        with np.load(self.path, allow_pickle=False) as checkpoint:
+            names = list(checkpoint["names"])
+            records = checkpoint["records"]
+        # Checkpoints saved before a field was added leave it at zero.
+        fields = [field for field in FIELDS if field in records.dtype.names]
+        restored = 0
+        for record in records[records["done"]]:
+            name = str(names[record["model"]])
+            if name in results.names and record["image"] < results.num_images:
+                results.set(name, int(record["image"]), {field: record[field] for field in fields})
+                # The restored images may not be loaded again, so their metrics come from the checkpoint too.
+                if all(field in fields for field in IMAGE_FIELDS):
+                    results.set_image(int(record["image"]), {field: record[field] for field in IMAGE_FIELDS})
+                restored += 1
+        return restored
+
+    def update(self, results):
+        """
+        This function will save the results if the interval has elapsed since the last save.
+        :param results: The BenchmarkResults to save.
+        """
+        if time.monotonic() - self.last_save >= self.interval:
+            self.save(results)
+
+    def save(self, results):
+        """
+        This function will save the results atomically, so a kill during the save keeps the previous checkpoint.
+        :param results: The BenchmarkResults to save.
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        temp = "{}.{}.tmp".format(self.path, os.getpid())
+        with open(temp, "wb") as fo:
+            np.savez(fo, names=np.array(results.names, dtype=str), records=results.records)
+            fo.flush()
+            os.fsync(fo.fileno())
+        os.replace(temp, self.path)
+        self.last_save = time.monotonic()
@@ -0,0 +1,169 @@
+import argparse
+import glob
+import importlib
+import json
+import os
+import sys
+import numpy as np
+from llimcobe.llimcobe import Llimcobe
+from llimcobe.dataset import NpyDataset, MemmapDataset, SubsetDataset
+from llimcobe.adapters import adapter
+
+# The set_model parameters that are given as "module:function" import paths in a config file.
+FUNCTION_PARAMETERS = ("model", "preprocess", "save", "load", "compare", "model_batch", "codec_timer")
+# The [benchmark] options that are paths, resolved from the directory of the config file.
+PATH_OPTIONS = ("output", "cache", "checkpoint", "archive", "store")
+
+
+def identity(image):
+    """
+    This function is the preprocess of the models that don't set one. It is shared by all of them, so the hashes
+    of the originals are computed once for all the models in hash verification mode.
+    :param image: The image.
+    :return: The same image.
+    """
+    return image
+
+
+def load_config(path: str) -> dict:
+    """
+    This function will read a benchmark config file.
+    :param path: The path of a .toml or .json config file. TOML files need Python 3.11 or the tomli package.
+    :return: A dictionary with the config.
+    """
+    if path.endswith(".json"):
+        with open(path) as fo:
+            return json.load(fo)
+    try:
+        import tomllib
+    except ImportError:
+        import tomli as tomllib
+    with open(path, "rb") as fo:
+        return tomllib.load(fo)
+
+
+def resolve(path: str):
+    """
+    This function will import an object from its import path.
+    :param path: The import path, as "package.module:name" or "package.module:name.attribute".
+    :return: The object.
+    """
+    module, _, name = path.partition(":")
+    value = importlib.import_module(module)
+    for attribute in name.split(".") if name else ():
+        value = getattr(value, attribute)
+    return value
+
+
+def build_dataset(config: dict, directory: str = "."):
+    """
+    This function will build the dataset of a config.
+    :param config: The [dataset] table, with a type of "npy" (paths, a list of glob patterns), "memmap" (path, shape,
+                   dtype and offset, see MemmapDataset) or "python" (function, the import path of a function that
+                   returns the dataset), and the optional start, stop and step of the subset to benchmark.
+    :param directory: The directory relative paths are resolved from.
+    :return: The dataset.
+    """
+    kind = config.get("type", "npy")
+    if kind == "npy":
+        paths = []
+        for pattern in config["paths"]:
+            paths.extend(sorted(glob.glob(os.path.join(directory, pattern))))
+        dataset = NpyDataset(paths)
+    elif kind == "memmap":
+        shape = tuple(config["shape"]) if "shape" in config else None
+        dataset = MemmapDataset(os.path.join(directory, config["path"]), shape, np.dtype(config.get("dtype", "uint8")),
+                                config.get("offset", 0))
+    elif kind == "python":
+        dataset = resolve(config["function"])()
+    else:
+        raise ValueError("Unknown dataset type: {}".format(kind))
+
+    if any(key in config for key in ("start", "stop", "step")):
+        indexes = range(len(dataset))[config.get("start"):config.get("stop"):config.get("step")]
+        dataset = SubsetDataset(dataset, indexes)
+    return dataset
+
+
+class ConfigBenchmark(Llimcobe):
+    """
+    A benchmark built from a config file, with its dataset and its models.
+    """
+    def __init__(self, config: dict, directory: str = "."):
+        """
+        :param config: A dictionary with the config, see load_config.
+        :param directory: The directory relative paths are resolved from.
+        """
+        self.config = config
+        self.directory = directory
+        scratch_dir = config.get("scratch_dir")
+        super().__init__(os.path.join(directory, scratch_dir) if scratch_dir else None)
+        for name, model in config.get("models", {}).items():
+            parameters = {"model": None, "preprocess": identity, "compare": None}
+            model = dict(model)
+            if "adapter" in model:
+                parameters.update(adapter(model.pop("adapter"), **model.pop("options", {})))
+            parameters.update(model)
+            for parameter in FUNCTION_PARAMETERS:
+                if isinstance(parameters.get(parameter), str):
+                    parameters[parameter] = resolve(parameters[parameter])
+            self.set_model(name, **parameters)
+
+    def prepare_dataset(self):
+        return build_dataset(self.config["dataset"], self.directory)
+
+
+def run(args):
+    """
+    This function will run the benchmark of a config file.
+    The [benchmark] table holds num_images, the options of benchmark and the output path, and the command-line
+    arguments override them. Relative paths of the config file are resolved from its directory.
+    :param args: The parsed command-line arguments.
+    """
+    config = load_config(args.config)
+    directory = os.path.dirname(os.path.abspath(args.config))
+    # Modules next to the config file can be imported by the import paths of the config.
+    sys.path.insert(0, directory)
+
+    options = dict(config.get("benchmark", {}))
+    for option in PATH_OPTIONS:
+        if options.get(option):
+            options[option] = os.path.join(directory, options[option])
+    output = options.pop("output", None)
+    if args.output:
+        output = args.output
+    if args.num_images is not None:
+        options["num_images"] = args.num_images
+    if args.workers is not None:
+        options["workers"] = args.workers
+
+    benchmark = ConfigBenchmark(config, directory)
+    if args.models:
+        benchmark.models = {name: benchmark.models[name] for name in args.models.split(",")}
+    num_images = options.pop("num_images", len(benchmark.lens))
+    results = benchmark.benchmark(num_images, plot=args.plot, **options)
+    if output:
+        results.save(output)
+
+
+def main(argv=None):
+    """
+    This function is the entry point of the llimcobe command.
+    :param argv: A list with the command-line arguments. Leave it empty to use sys.argv.
+    """
+    parser = argparse.ArgumentParser(prog="llimcobe", description="Lossless Image Compression Benchmark")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="run the benchmark of a config file")
+    run_parser.add_argument("config", help="path of the .toml or .json config file")
+    run_parser.add_argument("--num-images", type=int, help="number of images to benchmark")
+    run_parser.add_argument("--workers", type=int, help="number of worker processes")
+    run_parser.add_argument("--models", help="comma-separated names of the models to benchmark")
+    run_parser.add_argument("--output", help="path of a .csv, .json or .npz file to save the results to")
+    run_parser.add_argument("--plot", action="store_true", help="display a graphs with the results")
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import os
+from abc import ABC, abstractmethod
+import numpy as np
+
+
+class Dataset(ABC):
+    """
+    A class used to expose a dataset lazily, so images are only loaded when the benchmark reaches them.
+    """
+
+    @abstractmethod
+    def __len__(self):
+        """
+        :return: The number of images in the dataset.
+        """
+        pass
+
+    @abstractmethod
+    def load(self, index: int) -> np.ndarray:
+        """
+        This abstract method will be used to load a single image.
+        :param index: The index of the image.
+        :return: The image in HxWxC numpy.ndarray format.
+        """
+        pass
+
+    @abstractmethod
+    def size(self, index: int) -> int:
+        """
+        This abstract method will be used to know the number of subpixels of an image without decoding it.
+        :param index: The index of the image.
+        :return: The number of subpixels (H*W*C) of the image.
+        """
+        pass
+
+    def format(self, index: int) -> tuple:
+        """
+        This function will be used to know the shape and dtype of an image from its metadata, without loading it.
+        Datasets that don't override it have the shape and dtype read from every image when the benchmark loads it.
+        :param index: The index of the image.
+        :return: A tuple with the shape and the dtype of the image, or None if they aren't known from metadata.
+        """
+        return None
+
+    def __getitem__(self, index: int) -> np.ndarray:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("dataset index out of range")
+        return self.load(index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.load(index)
+
+
+class NpyDataset(Dataset):
+    """
+    A dataset of images stored one per .npy file.
+    """
+    def __init__(self, paths, mmap: bool = False):
+        """
+        :param paths: A list with the paths of the .npy files.
+        :param mmap: memory-map the images instead of reading them, e.g. to read tiles of large images.
+        """
+        self.paths = list(paths)
+        self.mmap = mmap
+
+    def __len__(self):
+        return len(self.paths)
+
+    def load(self, index):
+        return np.load(self.paths[index], mmap_mode="r" if self.mmap else None)
+
+    def size(self, index):
+        # Memory-mapping only parses the header, the image data is not read.
+        return int(np.prod(np.load(self.paths[index], mmap_mode="r").shape))
+
+    def format(self, index):
+        image = np.load(self.paths[index], mmap_mode="r")
+        return image.shape, image.dtype
+
+
+class MemmapDataset(Dataset):
+    """
+    A dataset of uniform-size images stored as a single HxWxC stack, either a raw file or a .npy file.
+    The stack is memory-mapped, so images are handed out as zero-copy views and never read as a whole.
+    """
+    def __init__(self, path: str, shape: tuple = None, dtype=np.uint8, offset: int = 0):
+        """
+        :param path: The path of the raw file or the .npy file.
+        :param shape: The HxWxC shape of a single image. Required for raw files, read from the header for .npy files.
+        :param dtype: The dtype of the raw file. Ignored for .npy files.
+        :param offset: number of header bytes before the first image of the raw file. Ignored for .npy files.
+        """
+        self.path = path
+        if path.endswith(".npy"):
+            self.stack = np.load(path, mmap_mode="r")
+        else:
+            if shape is None:
+                raise ValueError("The image shape is required for raw files")
+            image_bytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            count = (os.path.getsize(path) - offset) // image_bytes
+            self.stack = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(count, *shape))
+
+    def __len__(self):
+        return self.stack.shape[0]
+
+    def load(self, index):
+        return self.stack[index]
+
+    def size(self, index):
+        return int(np.prod(self.stack.shape[1:]))
+
+    def format(self, index):
+        return self.stack.shape[1:], self.stack.dtype
+
+
+class SubsetDataset(Dataset):
+    """
+    A dataset with a subset of the images of another dataset, e.g. a slice of it.
+    """
+    def __init__(self, dataset, indexes):
+        """
+        :param dataset: A Dataset or a list of images in HxWxC numpy.ndarray format.
+        :param indexes: The indexes of the images of the subset, e.g. a range.
+        """
+        self.dataset = dataset
+        self.indexes = list(indexes)
+
+    def __len__(self):
+        return len(self.indexes)
+
+    def load(self, index):
+        return self.dataset[self.indexes[index]]
+
+    def size(self, index):
+        if isinstance(self.dataset, Dataset):
+            return self.dataset.size(self.indexes[index])
+        return int(np.size(self.dataset[self.indexes[index]]))
+
+    def format(self, index):
+        if isinstance(self.dataset, Dataset):
+            return self.dataset.format(self.indexes[index])
+        image = self.dataset[self.indexes[index]]
+        return np.shape(image), np.asarray(image).dtype
+
+
+def image_sizes(dataset):
+    """
+    This function will compute the number of subpixels of every image of a dataset.
+    Datasets with a callable size accessor are measured from metadata, the rest with numpy.size.
+    :param dataset: A Dataset or a list of images in HxWxC numpy.ndarray format.
+    :return: A list with the number of subpixels of each image.
+    """
+    size = getattr(dataset, "size", None)
+    if callable(size):
+        return [size(index) for index in range(len(dataset))]
+    return list(map(np.size, dataset))
+
+
+def image_formats(dataset, num_images: int):
+    """
+    This function will find the shape and dtype of the first images of a dataset, without loading them.
+    :param dataset: A Dataset or a list of images in HxWxC numpy.ndarray format.
+    :param num_images: number of images.
+    :return: A list with a (shape, dtype) tuple per image, or None for the images of a Dataset that can't read
+             them from metadata.
+    """
+    if isinstance(dataset, Dataset):
+        return [dataset.format(index) for index in range(num_images)]
+    return [(np.shape(image), np.asarray(image).dtype) for image in dataset[:num_images]]
@@ -1,34 +1,116 @@
+import io
 import os
 import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from functools import partial
 from threading import Thread
 import warnings
 from abc import ABC, abstractmethod
-import matplotlib.pyplot as plt
 import numpy as np
-from typing import Callable, Any, TypeVar, Union
+from typing import Callable, Any, TypeVar, Union, List
+from llimcobe.dataset import image_sizes, image_formats
+from llimcobe.metrics import image_metrics
+from llimcobe.scratch import ScratchSpace
+from llimcobe.stats import timing_stats
+from llimcobe.results import BenchmarkResults
+from llimcobe.cache import ResultCache, image_hash
+from llimcobe.checkpoint import Checkpoint
+from llimcobe.prefetch import Prefetcher
+from llimcobe.verify import Verification, default_compare
+from llimcobe.probes import ResourceProbe, SAMPLE_KEYS, share_sample, aggregate_samples
+from llimcobe.archive import Archive
+from llimcobe.store import ArtifactStore
+from llimcobe.scaling import ScalingResults
+
+_worker = {}
+
+
+def _init_worker(benchmark, counter, pin_cpus, options):
+    """
+    This function will prepare a worker process of the parallel benchmark.
+    :param benchmark: The Llimcobe instance inherited from the parent process.
+    :param counter: A shared counter used to give each worker a different CPU.
+    :param pin_cpus: pin the worker process to a single CPU.
+    :param options: A dictionary with the benchmark options.
+    """
+    _worker["benchmark"] = benchmark
+    _worker["options"] = options
+    _worker["hashes"] = {}
+    # Every worker reads the cache through its own connection, only the parent process writes to it.
+    _worker["cache"] = ResultCache(options["cache"], options=options) if options["cache"] else None
+    _worker["store"] = ArtifactStore(options["store"], options["store_max_bytes"]) if options["store"] else None
+    if pin_cpus:
+        with counter.get_lock():
+            slot = counter.value
+            counter.value += 1
+        cpus = sorted(os.sched_getaffinity(0))
+        os.sched_setaffinity(0, {cpus[slot % len(cpus)]})
+
+
+def _run_item(item):
+    """
+    This function will benchmark a batch of (model, image) pairs inside a worker process.
+    :param item: A tuple with the model name and a tuple with the image indexes. Without a batch model,
+                 the tuple holds a single index.
+    :return: A list with a dictionary per image with the image hash, the metrics of the original image and either
+             the cached result fields or the measure of the image without the decompressed image.
+    """
+    name, indexes = item
+    benchmark = _worker["benchmark"]
+    outcomes = {}
+    measured = []
+    keys = []
+    images = []
+    for index in indexes:
+        image = benchmark.dataset[index]
+        metrics = image_metrics(np.shape(image), np.asarray(image).dtype, _worker["options"]["bit_depth"])
+        key = None
+        if _worker["cache"] is not None or _worker["options"]["store"]:
+            key = image_hash(image)
+        if _worker["cache"] is not None:
+            fields = _worker["cache"].get(name, benchmark.models[name]["version"], key)
+            if fields is not None:
+                outcomes[index] = {"key": key, "image": metrics, "fields": fields}
+                continue
+        outcomes[index] = {"key": key, "image": metrics}
+        measured.append(index)
+        keys.append(key)
+        images.append(benchmark.models[name]["preprocess"](image))
+    del image
+
+    if images:
+        measures = benchmark._measure(name, images, [benchmark.lens[index] for index in measured],
+                                      [benchmark.scratch.path(os.getpid(), name, index) for index in measured],
+                                      _worker["options"], indexes=measured, hashes=_worker["hashes"], keys=keys,
+                                      store=_worker["store"])
+        for index, measure in zip(measured, measures):
+            del measure["loaded"]
+            outcomes[index]["measure"] = measure
+    return [outcomes[index] for index in indexes]
 
 
 class Llimcobe(ABC):
     """
     A class used to make a lossless image benchmark with some models.
     """
-    def __init__(self):
+    def __init__(self, scratch_dir: str = None):
+        """
+        :param scratch_dir: directory where compressed images are written during the benchmark, e.g. a tmpfs mount.
+                            Leave it at None to use the system temporary directory.
+        """
         super().__init__()
         self.models = {}
         self.dataset = self.prepare_dataset()
-        self.lens = list(map(np.size, self.dataset))
-        temp = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".temp"))
-        if not os.path.exists(temp):
-            os.makedirs(temp)
-        self.temp = os.path.join(temp, "img")
-        if os.path.exists(self.temp):
-            os.remove(self.temp)
+        self.lens = image_sizes(self.dataset)
+        self.scratch = ScratchSpace(scratch_dir)
 
     @abstractmethod
     def prepare_dataset(self):
         """
         This abstract method will be used to prepare dataset.
-        :return: A list of images in HxWxC numpy.ndarray format.
+        :return: A list of images in HxWxC numpy.ndarray format, or a Dataset to load the images lazily.
         """
         pass
 
@@ -37,9 +119,11 @@ class Llimcobe(ABC):
 
     def set_model(self, name: str, model: Union[None, Callable[[T1], T2]],
                   preprocess: Callable[[np.ndarray], T1],
-                  save: Union[Callable[[T1, str], Any], Callable[[T2, str], Any]],
-                  load: Callable[[str], np.ndarray],
-                  compare: Callable[[Union[T1, T2], Union[T1, T2]], bool]):
+                  save: Union[Callable[[T1, Union[str, io.BytesIO]], Any], Callable[[T2, Union[str, io.BytesIO]], Any]],
+                  load: Callable[[Union[str, io.BytesIO]], np.ndarray],
+                  compare: Callable[[Union[T1, T2], Union[T1, T2]], bool], version: str = None,
+                  model_batch: Callable[[List[T1]], List[T2]] = None, batch_size: int = 1,
+                  codec_timer: Callable[[], Union[None, int]] = None):
         """
         This function includes into a dictionary the model.
         If the name exists in models dictionary the model will be overwritten.
@@ -50,12 +134,24 @@ class Llimcobe(ABC):
         :param save: function to save compressed image. If the model is auto-saved,
                     pass the calling function through this variable.
         :param load: function to load the image and transform to np.ndarray image.
-        :param compare: function that compare 2 objects of the same type (preprocess object). Leave empty if == works.
+                     save and load receive a path, or a BytesIO buffer when the benchmark runs in_memory.
+        :param compare: function that compare 2 objects of the same type (preprocess object). Leave empty to use
+                        default_compare, which checks ndarray images with compare_arrays and the rest with ==.
+        :param version: version of the model, used to invalidate its cached results when it changes.
+        :param model_batch: function that calls the model over a list of images and returns the list of compressed
+                            images, each one saved with save. If given, it is used instead of model.
+        :param batch_size: number of images passed to model_batch at once.
+        :param codec_timer: function called after every timed compression and decompression that returns the time
+                            in nanoseconds the codec reported for it, e.g. read from the output of a subprocess,
+                            or None if it didn't report one. It is recorded next to the wall time, so the overhead
+                            of the wrapper can be told apart.
         :return: True if model is included, false if not.
         """
         if (name and model and save and load) or (name and save and load):
             self.models[name] = {"model": model, "preprocess": preprocess, "save": save, "load": load,
-                                 "compare": compare if compare else lambda x, y: x == y}
+                                 "compare": compare if compare else default_compare, "version": version,
+                                 "model_batch": model_batch, "batch_size": max(1, batch_size),
+                                 "codec_timer": codec_timer}
             return True
 
         return False
@@ -67,6 +163,8 @@ class Llimcobe(ABC):
         :return: The model if exists, False if not.
         """
         if name in self.models.keys():
+            if self.models[name]["model_batch"]:
+                return self.models[name]["model_batch"]
             if self.models[name]["model"]:
                 return self.models[name]["model"]
             return self.models[name]["save"]
@@ -83,40 +181,279 @@ class Llimcobe(ABC):
             return True
         return False
 
-    def benchmark(self, num_images: int):
+    @staticmethod
+    def _warn_mismatch(name, index, match):
         """
-        This function will create the benchmark and will display a graphs with the results.
-        :param num_images: number of images that will be used from dataset for benchmark.
-        :return: None
+        This function will warn that a decompressed image doesn't match its original.
+        :param name: The name of the model.
+        :param index: The index of the image.
+        :param match: The value returned by the compare function, e.g. a Verification with the mismatch details.
         """
+        reason = getattr(match, "reason", "")
+        warnings.warn("Pre-compressed image and post-decompressed image don't match ({} model, image {}{})".format(
+            name, index, ", " + reason if reason else ""))
 
-        fig, axs = plt.subplots(2, 3)
-        all_bpsp = {}
-        all_throughput = {}
-        all_dthroughput = {}
-        lossy_flag = False
+    def _measure(self, name, images, lengths, paths, options, gate=None, indexes=None, hashes=None, keys=None,
+                 store=None):
+        """
+        This function will compress and decompress preprocessed images with a model.
+        With a batch model all the images are compressed in a single call, and the batch time is apportioned to
+        every image by its number of subpixels. Otherwise the images are compressed one by one.
+        Every image is compressed in every run first, then the bitstream of the last run is decompressed in every run.
+        In hash verification mode the entries of images are released between both phases, so the original and the
+        decompressed image are never held together. The bitstreams of the last run are kept in the archive if one is
+        given, and in the artifact store if one is given. In decode-only mode the compression phase is replaced by
+        reading them from the archive, or from the artifact store.
+        :param name: The name of the model.
+        :param images: A list with the preprocessed images.
+        :param lengths: A list with the number of subpixels of the images.
+        :param paths: A list with the paths used to save the compressed images.
+        :param options: A dictionary with the benchmark options.
+        :param gate: A context manager entered during the timed regions, so background work doesn't overlap them,
+                     or None.
+        :param indexes: A list with the indexes of the images, used to cache the hashes of the originals.
+        :param hashes: A dictionary where the hashes of the preprocessed originals are cached by preprocess function
+                       and image index, so they are computed once for all the models. Only used in hash mode.
+        :param keys: A list with the content hashes of the original images, used by the artifact store.
+        :param store: The ArtifactStore of the run, or None.
+        :return: A list with a dictionary per image with the compressed size in bytes,
+                 the median codec, batch and I/O times and codec-reported times in nanoseconds,
+                 the resources used compressing and decompressing (see probes.aggregate_samples),
+                 the statistics of the repeated codec times, whether the decompressed image matches
+                 and the preprocessed decompressed image (None in hash mode).
+        """
+        model = self.models[name]
+        batched = model["model_batch"] is not None
+        hash_mode = options["verify"] == "hash"
+        shares = np.asarray(lengths, dtype=np.float64) / sum(lengths)
+        runs = options["warmup"] + options["repeats"]
+        batch_times = []
+        encode_times = [[] for _ in images]
+        decode_times = [[] for _ in images]
+        encode_codec_times = [[] for _ in images]
+        decode_codec_times = [[] for _ in images]
+        encode_samples = [[] for _ in images]
+        decode_samples = [[] for _ in images]
+        write_times = [[] for _ in images]
+        read_times = [[] for _ in images]
+        sizes = [0] * len(images)
+        matches = [None] * len(images)
+        decoded = [None] * len(images)
+        gate = gate if gate is not None else nullcontext()
+        probe = ResourceProbe(options["resource_probes"], options["trace_allocations"])
 
-        for name in self.models:
-            dataset = list(map(self.models[name]["preprocess"], self.dataset))
-            compression_throughput = []
-            decompression_throughput = []
-            bpsp = []
-            for (image, length, _) in zip(dataset, self.lens, range(num_images)):
-                start_time = time.perf_counter()
-                if self.models[name]["model"]:
-                    compressed = self.models[name]["model"](image)
-                    self.models[name]["save"](compressed, self.temp)
+        def codec_time():
+            # The timer is called after the timed region, so it doesn't add to the wall time.
+            reported = model["codec_timer"]() if model["codec_timer"] else None
+            return -1 if reported is None else reported
+
+        if hash_mode:
+            original_hashes = []
+            for ix, image in enumerate(images):
+                key = (model["preprocess"], indexes[ix]) if indexes is not None and hashes is not None else None
+                if key is None or key not in hashes:
+                    digest = image_hash(np.asarray(image))
+                    if key is None:
+                        original_hashes.append(digest)
+                        continue
+                    hashes[key] = digest
+                original_hashes.append(hashes[key])
+
+        archive = Archive(options["archive"]) if options["archive"] else None
+        if options["decode_only"]:
+            # The bitstreams were compressed by an earlier run, so only the decompression is timed.
+            targets = []
+            for ix, index in enumerate(indexes):
+                if archive is not None:
+                    path = archive.find(name, index)
+                else:
+                    path = store.find(name, model["version"], keys[ix])
+                sizes[ix] = os.path.getsize(path)
+                if options["in_memory"]:
+                    with open(path, "rb") as fo:
+                        targets.append(io.BytesIO(fo.read()))
+                else:
+                    targets.append(path)
+                encode_times[ix].append(-1)
+                encode_codec_times[ix].append(-1)
+                encode_samples[ix].append(dict.fromkeys(SAMPLE_KEYS, -1))
+                write_times[ix].append(-1)
+                read_times[ix].append(-1)
+            batch_times.append(-1)
+        else:
+            # The first warmup runs are discarded, so warmup effects and cold caches stay out of the timings.
+            for run in range(runs):
+                targets = [io.BytesIO() if options["in_memory"] else path for path in paths]
+
+                if batched:
+                    with gate:
+                        with probe:
+                            start_time = time.perf_counter_ns()
+                            for compressed, target in zip(model["model_batch"](images), targets):
+                                model["save"](compressed, target)
+                            batch_time = time.perf_counter_ns() - start_time
+                    image_times = [batch_time * share for share in shares]
+                    image_samples = [share_sample(probe.sample, share) for share in shares]
+                    batch_codec_time = codec_time()
+                    image_codec_times = [batch_codec_time * share if batch_codec_time >= 0 else -1 for share in shares]
                 else:
-                    self.models[name]["save"](image, self.temp)
-                elapsed_time1 = time.perf_counter() - start_time
+                    image_times = []
+                    image_codec_times = []
+                    image_samples = []
+                    for image, target in zip(images, targets):
+                        with gate:
+                            with probe:
+                                start_time = time.perf_counter_ns()
+                                if model["model"]:
+                                    compressed = model["model"](image)
+                                    model["save"](compressed, target)
+                                else:
+                                    model["save"](image, target)
+                                image_times.append(time.perf_counter_ns() - start_time)
+                        image_codec_times.append(codec_time())
+                        image_samples.append(probe.sample)
+                    batch_time = sum(image_times)
+
+                for ix, (target, path) in enumerate(zip(targets, paths)):
+                    if options["in_memory"]:
+                        buffer = target.getbuffer()
+                        sizes[ix] = buffer.nbytes
+                        # Time the file round trip apart, so codec time and I/O time are reported separately.
+                        with gate:
+                            start_time = time.perf_counter_ns()
+                            with open(path, "wb") as fo:
+                                fo.write(buffer)
+                                fo.flush()
+                                os.fsync(fo.fileno())
+                            write_time = time.perf_counter_ns() - start_time
+                        del buffer
+
+                        with gate:
+                            start_time = time.perf_counter_ns()
+                            with open(path, "rb") as fo:
+                                fo.read()
+                            read_time = time.perf_counter_ns() - start_time
+                        os.remove(path)
+                    else:
+                        sizes[ix] = os.path.getsize(path)
+                        write_time = read_time = -1
+                        if run < runs - 1:
+                            os.remove(path)
+
+                    if run >= options["warmup"]:
+                        encode_times[ix].append(image_times[ix])
+                        encode_codec_times[ix].append(image_codec_times[ix])
+                        encode_samples[ix].append(image_samples[ix])
+                        write_times[ix].append(write_time)
+                        read_times[ix].append(read_time)
+                if run >= options["warmup"]:
+                    batch_times.append(batch_time)
+            if archive is not None:
+                for index, target in zip(indexes, targets):
+                    archive.store(name, index, target)
+            if store is not None:
+                for key, target in zip(keys, targets):
+                    store.put(name, model["version"], key, target)
+
+        if hash_mode:
+            for ix in range(len(images)):
+                images[ix] = None
+            # The loop variables would otherwise keep the last original alive during the decompression.
+            image = compressed = None
+
+        for run in range(runs):
+            for ix, target in enumerate(targets):
+                if options["in_memory"]:
+                    target.seek(0)
+                with gate:
+                    with probe:
+                        start_time = time.perf_counter_ns()
+                        loaded = model["load"](target)
+                        decode_time = time.perf_counter_ns() - start_time
+                decode_codec_time = codec_time()
+                if run >= options["warmup"]:
+                    decode_times[ix].append(decode_time)
+                    decode_codec_times[ix].append(decode_codec_time)
+                    decode_samples[ix].append(probe.sample)
+
+                if run == runs - 1:
+                    # The verification runs after the timed regions of the image.
+                    loaded = model["preprocess"](loaded)
+                    if hash_mode:
+                        if image_hash(np.asarray(loaded)) == original_hashes[ix]:
+                            matches[ix] = Verification(True)
+                        else:
+                            matches[ix] = Verification(False, "the hash of the decompressed image doesn't match", -1)
+                    else:
+                        matches[ix] = model["compare"](images[ix], loaded)
+                        decoded[ix] = loaded
+                loaded = None
+
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
 
-                start_time = time.perf_counter()
-                loaded = self.models[name]["load"](self.temp)
-                elapsed_time2 = time.perf_counter() - start_time
-                pixel_size = loaded.dtype.itemsize * 8
-                loaded = self.models[name]["preprocess"](loaded)
-                if not self.models[name]["compare"](image, loaded) and lossy_flag is False:
-                    warnings.warn("Pre-compressed image and post-decompressed image don't match")
+        measures = []
+        for ix in range(len(images)):
+            encode_stats = timing_stats(encode_times[ix])
+            decode_stats = timing_stats(decode_times[ix])
+            match = matches[ix]
+            measure = {"bytes": sizes[ix], "encode_ns": encode_stats["median"],
+                       "decode_ns": decode_stats["median"],
+                       "encode_stats": encode_stats, "decode_stats": decode_stats,
+                       "batch_ns": np.median(batch_times) if batched else -1,
+                       "batch_size": len(images) if batched else 1,
+                       "encode_codec_ns": np.median(encode_codec_times[ix]),
+                       "decode_codec_ns": np.median(decode_codec_times[ix]),
+                       "write_ns": np.median(write_times[ix]), "read_ns": np.median(read_times[ix]),
+                       "mismatches": getattr(match, "mismatches", 0 if match else -1),
+                       "match": match, "loaded": decoded[ix]}
+            for step, samples in (("encode", encode_samples[ix]), ("decode", decode_samples[ix])):
+                for key, value in aggregate_samples(samples).items():
+                    measure["{}_{}".format(step, key)] = value
+            measures.append(measure)
+        return measures
+
+    def _run_serial(self, options, results, cache, checkpoint, store=None):
+        """
+        This function will run every model over the images in the current process.
+        :param options: A dictionary with the benchmark options.
+        :param results: The BenchmarkResults where the measures are stored.
+        :param cache: The ResultCache used to skip unchanged (model, image) pairs, or None.
+        :param checkpoint: The Checkpoint where finished results are saved periodically, or None.
+        :param store: The ArtifactStore where the compressed images are kept, or None.
+        :return: A generator of the (model name, image index) pairs as soon as they are finished.
+        """
+        lossy_flag = False
+        keys = {}
+        hashes = {}
+
+        def prepare(name, index):
+            # Load and preprocess one image at a time, so only the current and the prefetched images are held.
+            # The cache is looked up right after hashing, so cached images are not preprocessed.
+            image = self.dataset[index]
+            results.set_image(index, image_metrics(np.shape(image), np.asarray(image).dtype, options["bit_depth"]))
+            if (cache is not None or options["store"]) and index not in keys:
+                keys[index] = image_hash(image)
+            if cache is not None:
+                fields = cache.get(name, self.models[name]["version"], keys[index])
+                if fields is not None:
+                    return fields, None
+            return None, self.models[name]["preprocess"](image)
+
+        def run_batch(name, batch, gate):
+            nonlocal lossy_flag
+            indexes = [index for index, _ in batch]
+            images = [image for _, image in batch]
+            # In hash mode only the list passed to _measure holds the originals, so they can be released.
+            batch.clear()
+            measures = self._measure(name, images, [self.lens[index] for index in indexes],
+                                     [self.scratch.path(os.getpid(), name, index) for index in indexes],
+                                     options, gate, indexes, hashes, [keys.get(index) for index in indexes], store)
+            for index, image, measure in zip(indexes, images, measures):
+                loaded = measure.pop("loaded")
+                if not measure["match"] and lossy_flag is False:
+                    self._warn_mismatch(name, index, measure["match"])
 
                     try:
                         t1 = Thread(target=image.show)
@@ -130,65 +467,255 @@ class Llimcobe(ABC):
                     except:
                         pass
                     lossy_flag = True
+                results.add(name, index, measure)
+                if cache is not None:
+                    cache.put(name, self.models[name]["version"], keys[index], results.get(name, index))
+                if checkpoint is not None:
+                    checkpoint.update(results)
+            return indexes
 
-                image_size = os.path.getsize(self.temp) * 8
-                os.remove(self.temp)
-                bpsp.append(float(image_size / length))
-                compression_throughput.append(float((length * pixel_size / (8 * 10 ** 6)) / elapsed_time1))
-                decompression_throughput.append(float((length * pixel_size / (8 * 10 ** 6)) / elapsed_time2))
+        for name in self.models:
+            batch_size = self.models[name]["batch_size"] if self.models[name]["model_batch"] else 1
+            indexes = [index for index in range(results.num_images) if not results.done(name, index)]
+            with Prefetcher(partial(prepare, name), indexes, options["prefetch"],
+                            options["prefetch_threads"]) as prefetcher:
+                batch = []
+                for index, (fields, image) in prefetcher:
+                    if fields is not None:
+                        results.set(name, index, fields)
+                        results.cache_hits += 1
+                        if checkpoint is not None:
+                            checkpoint.update(results)
+                        yield name, index
+                        continue
+                    if cache is not None:
+                        results.cache_misses += 1
+                    batch.append((index, image))
+                    del image
+                    if len(batch) == batch_size:
+                        for finished in run_batch(name, batch, prefetcher.gate):
+                            yield name, finished
+                if batch:
+                    for finished in run_batch(name, batch, prefetcher.gate):
+                        yield name, finished
 
-            all_bpsp[name] = bpsp
-            all_throughput[name] = compression_throughput
-            all_dthroughput[name] = decompression_throughput
+    def _run_parallel(self, workers, pin_cpus, options, results, cache, checkpoint):
+        """
+        This function will spread the (model, image) pairs over a pool of processes.
+        The pool is forked, so models, preprocess functions and the dataset are inherited without pickling.
+        :param workers: number of worker processes.
+        :param pin_cpus: pin each worker process to a different CPU.
+        :param options: A dictionary with the benchmark options.
+        :param results: The BenchmarkResults where the measures are stored.
+        :param cache: The ResultCache used to skip unchanged (model, image) pairs, or None.
+        :param checkpoint: The Checkpoint where finished results are saved periodically, or None.
+        :return: A generator of the (model name, image index) pairs as soon as they are finished, in dataset order.
+        """
+        context = multiprocessing.get_context("fork")
+        counter = context.Value("i", 0)
+        items = []
+        for name in self.models:
+            batch_size = self.models[name]["batch_size"] if self.models[name]["model_batch"] else 1
+            indexes = [index for index in range(results.num_images) if not results.done(name, index)]
+            items += [(name, tuple(indexes[start:start + batch_size])) for start in range(0, len(indexes), batch_size)]
+        lossy_flag = False
 
-        for ix, name in enumerate(self.models):
-            print('{} model have a compression rate of {}bpsp'.format(name, sum(all_bpsp[name]) / len(all_bpsp[name])))
-            print('{} model have a compression throughput of {}MB/s'.format(name, sum(all_throughput[name]) /
-                                                                            len(all_throughput[name])))
-            print('{} model have a decompression throughput of {}MB/s'.format(name, sum(all_dthroughput[name]) /
-                                                                              len(all_dthroughput[name])))
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(self, counter, pin_cpus, options)) as executor:
+            for (name, indexes), outcomes in zip(items, executor.map(_run_item, items)):
+                for index, outcome in zip(indexes, outcomes):
+                    results.set_image(index, outcome["image"])
+                    if "fields" in outcome:
+                        results.set(name, index, outcome["fields"])
+                        results.cache_hits += 1
+                        if checkpoint is not None:
+                            checkpoint.update(results)
+                        yield name, index
+                        continue
+                    measure = outcome["measure"]
+                    if not measure["match"] and lossy_flag is False:
+                        self._warn_mismatch(name, index, measure["match"])
+                        lossy_flag = True
+                    results.add(name, index, measure)
+                    if cache is not None:
+                        results.cache_misses += 1
+                        cache.put(name, self.models[name]["version"], outcome["key"], results.get(name, index))
+                    if checkpoint is not None:
+                        checkpoint.update(results)
+                    yield name, index
 
+    def iter_benchmark(self, num_images: int, workers: int = None, pin_cpus: bool = False, in_memory: bool = False,
+                       warmup: int = 0, repeats: int = 1, cache: str = None,
+                       checkpoint: str = None, checkpoint_interval: float = 60.0, resume: bool = False,
+                       prefetch: int = 0, prefetch_threads: int = 1, verify: str = "compare", bit_depth: int = None,
+                       resource_probes: bool = True, trace_allocations: bool = False, archive: str = None,
+                       decode_only: bool = False, store: str = None, store_max_bytes: int = None):
+        """
+        This function will prepare the benchmark to run as a generator, yielding a record as soon as every
+        (model, image) pair is finished. The options are checked, and the checkpoint is resumed, before it returns.
+        The parameters are the ones of benchmark.
+        :return: A tuple with a generator of dictionaries with the model name, the image index, the compressed size
+                 in bits, the number of subpixels, the compression and decompression times in seconds and whether
+                 the decompressed image matches, and the BenchmarkResults filled while the generator runs.
+        """
+        if repeats < 1:
+            raise ValueError("repeats must be at least 1")
+        if verify not in ("compare", "hash"):
+            raise ValueError("verify must be \"compare\" or \"hash\"")
+        if decode_only and not (archive or store):
+            raise ValueError("decode_only needs the archive or the artifact store of an earlier run")
+        if decode_only and cache:
+            raise ValueError("decode_only results can't be cached, they have no compression times")
+        if workers and "fork" not in multiprocessing.get_all_start_methods():
+            raise ValueError("Parallel runs fork the worker processes, which this platform doesn't support")
+        if workers and pin_cpus and not hasattr(os, "sched_setaffinity"):
+            warnings.warn("This platform can't pin processes to CPUs, the workers run unpinned")
+            pin_cpus = False
+        options = {"in_memory": in_memory, "warmup": warmup, "repeats": repeats, "cache": cache,
+                   "prefetch": prefetch, "prefetch_threads": prefetch_threads, "verify": verify,
+                   "bit_depth": bit_depth, "resource_probes": resource_probes,
+                   "trace_allocations": trace_allocations, "archive": archive, "decode_only": decode_only,
+                   "store": store, "store_max_bytes": store_max_bytes}
+        num_images = min(num_images, len(self.lens))
+        # The metrics are computed from the original images, so models with different preprocess types compare.
+        # Images whose format isn't known from metadata get their metrics when they are loaded.
+        images = [image_metrics(*image_format, bit_depth) if image_format is not None else None
+                  for image_format in image_formats(self.dataset, num_images)]
+        results = BenchmarkResults(list(self.models), num_images, options, images)
+        run_checkpoint = Checkpoint(checkpoint, checkpoint_interval) if checkpoint else None
+        if run_checkpoint is not None and resume:
+            print('Resumed {} results from the checkpoint'.format(run_checkpoint.load(results)))
+        return self._run(workers, pin_cpus, options, results, run_checkpoint), results
 
-        for name in self.models:
-            all_bpsp[name].sort()
-            bpsp = all_bpsp[name]
-            axs[0, 0].plot(bpsp, label=name)
-        axs[0, 0].legend()
-        axs[0, 0].set(xlabel="Sorted Images Index", ylabel="Compression Rate [bpsp]")
+    def _run(self, workers, pin_cpus, options, results, run_checkpoint):
+        """
+        This function will run the benchmark prepared by iter_benchmark.
+        The cache and the artifact store are opened when the generator starts, and closed when it finishes.
+        :param workers: number of worker processes, or None to run it serially.
+        :param pin_cpus: pin each worker process to a different CPU.
+        :param options: A dictionary with the benchmark options.
+        :param results: The BenchmarkResults where the measures are stored.
+        :param run_checkpoint: The Checkpoint where finished results are saved periodically, or None.
+        :return: A generator of the records of iter_benchmark.
+        """
+        result_cache = ResultCache(options["cache"], options=options) if options["cache"] else None
+        # Worker processes open the artifact store through their own connection.
+        artifact_store = None
+        if options["store"] and not workers:
+            artifact_store = ArtifactStore(options["store"], options["store_max_bytes"])
 
-        for name in self.models:
-            all_throughput[name].sort()
-            compression_throughput = all_throughput[name]
-            axs[0, 1].plot(compression_throughput, label=name)
-        axs[0, 1].legend()
-        axs[0, 1].set(xlabel="Sorted Images Index", ylabel="Compression Throughput [MB/s]", ylim=0.01, yscale="log")
+        try:
+            with self.scratch:
+                if workers:
+                    finished = self._run_parallel(workers, pin_cpus, options, results, result_cache, run_checkpoint)
+                else:
+                    finished = self._run_serial(options, results, result_cache, run_checkpoint, artifact_store)
+                for name, index in finished:
+                    yield results.record(name, index)
+        finally:
+            if result_cache is not None:
+                result_cache.close()
+            if artifact_store is not None:
+                artifact_store.close()
+            if run_checkpoint is not None:
+                run_checkpoint.save(results)
 
-        for name in self.models:
-            all_dthroughput[name].sort()
-            decompression_throughput = all_dthroughput[name]
-            axs[0, 2].plot(decompression_throughput, label=name)
-        axs[0, 2].legend()
-        axs[0, 2].set(xlabel="Sorted Images Index", ylabel="Decompression Throughput [MB/s]", ylim=0.01, yscale="log")
-
-        markers = ['o', 'v', '^', '<', '>', '8', 's', 'p', '*', 'h', 'H', 'D', 'd', 'P', 'X']
-
-        fig.delaxes(axs[1, 0])
-
-        for ix, name in enumerate(self.models):
-            axs[1, 1].scatter(sum(all_bpsp[name]) / len(all_bpsp[name]),
-                              sum(all_throughput[name]) / len(all_throughput[name]), label=name,
-                              marker=markers[ix % len(markers)])
-
-        axs[1, 1].legend()
-        axs[1, 1].set(xlabel="Compression Rate [bpsp]", ylabel="Compression Throughput [MB/s]", ylim=0.01, xlim=0,
-                      yscale="log")
-
-        for ix, name in enumerate(self.models):
-            axs[1, 2].scatter(sum(all_bpsp[name]) / len(all_bpsp[name]),
-                              sum(all_dthroughput[name]) / len(all_dthroughput[name]), label=name,
-                              marker=markers[ix % len(markers)])
-        axs[1, 2].legend()
-        axs[1, 2].set(xlabel="Compression Rate [bpsp]", ylabel="Decompression Throughput [MB/s]", ylim=0.01, xlim=0,
-                      yscale="log")
-
-        plt.show()
+    def benchmark(self, num_images: int, workers: int = None, pin_cpus: bool = False, in_memory: bool = False,
+                  warmup: int = 0, repeats: int = 1, plot: bool = True, cache: str = None,
+                  checkpoint: str = None, checkpoint_interval: float = 60.0, resume: bool = False,
+                  prefetch: int = 0, prefetch_threads: int = 1, verify: str = "compare", bit_depth: int = None,
+                  resource_probes: bool = True, trace_allocations: bool = False, archive: str = None,
+                  decode_only: bool = False, store: str = None, store_max_bytes: int = None,
+                  callback: Callable[[dict], Any] = None):
+        """
+        This function will create the benchmark, print the results and optionally display a graphs with them.
+        :param num_images: number of images that will be used from dataset for benchmark.
+        :param workers: number of processes used to run the benchmark. Leave it at None to run it serially.
+        :param pin_cpus: pin each worker process to a different CPU, so timings from different workers don't interfere.
+                         Only Linux supports it, elsewhere it is skipped with a warning.
+        :param in_memory: save and load receive a BytesIO buffer instead of a path, so the codec is timed without
+                          filesystem I/O. The file write and read times are measured and reported apart.
+        :param warmup: number of untimed runs of each model over each image before timing it.
+        :param repeats: number of timed runs of each model over each image. The median time is used for throughput.
+        :param plot: display a graphs with the results. Set it to False on headless machines.
+        :param cache: path of an SQLite database where results are cached by model name, model version and image hash.
+                      Cached (model, image) pairs are not benchmarked again by runs with the same timing options,
+                      see cache.TIMING_OPTIONS.
+        :param checkpoint: path of a file where the finished (model, image) results are saved periodically.
+        :param checkpoint_interval: minimum number of seconds between two checkpoint saves.
+        :param resume: restore the finished results of the checkpoint and only benchmark the remaining ones.
+        :param prefetch: number of images loaded and preprocessed ahead on background threads while the current one
+                         is measured. The background work waits while an image is being timed. Serial runs only.
+        :param prefetch_threads: number of background threads used to prefetch images.
+        :param verify: "compare" to verify every image with the compare function of the model, or "hash" to compare
+                       the hash of the decompressed image with the hash of the original, so both are never held
+                       in memory together. The hashes of the originals are computed once for all the models with
+                       the same preprocess function.
+        :param bit_depth: number of significant bits of every subpixel of the dataset, e.g. 12 for 12-bit data
+                          stored in uint16. It is used for the compression ratio. Leave it empty to use every bit
+                          of the dtype.
+        :param resource_probes: measure the user and system CPU time and the peak RSS growth of every compression
+                                and decompression.
+        :param trace_allocations: measure the peak of the Python allocations of every compression and decompression
+                                  with tracemalloc. It slows down the codecs, so it is off by default.
+        :param archive: directory where the compressed images are kept, with a subdirectory per model and a file
+                        per image index.
+        :param decode_only: skip the compression and time the decompression of the compressed images kept in the
+                            archive, or in the artifact store, by an earlier run. The decompressed images are still
+                            verified against the originals.
+        :param store: directory of an artifact store where the compressed images are kept by model name, model
+                      version and image hash, so later runs and other datasets with the same images can reuse them.
+        :param store_max_bytes: maximum size in bytes of the artifact store. The least recently used compressed
+                                images are evicted first.
+        :param callback: function called with the record of every (model, image) pair as soon as it is finished.
+                         See iter_benchmark.
+        :return: A BenchmarkResults with the per-model, per-image results.
+        """
+        records, results = self.iter_benchmark(num_images, workers=workers, pin_cpus=pin_cpus, in_memory=in_memory,
+                                               warmup=warmup, repeats=repeats, cache=cache, checkpoint=checkpoint,
+                                               checkpoint_interval=checkpoint_interval, resume=resume,
+                                               prefetch=prefetch, prefetch_threads=prefetch_threads, verify=verify,
+                                               bit_depth=bit_depth, resource_probes=resource_probes,
+                                               trace_allocations=trace_allocations, archive=archive,
+                                               decode_only=decode_only, store=store, store_max_bytes=store_max_bytes)
+        for record in records:
+            if callback:
+                callback(record)
+
+        results.report()
+        if plot:
+            results.plot()
+        return results
+
+    def scaling_sweep(self, name: str, factory: Callable[[int], dict], threads: List[int], num_images: int,
+                      plot: bool = True, **options):
+        """
+        This function will measure how the throughput of a multithreaded codec scales with its number of threads.
+        The codec is benchmarked once per thread count, apart from the models set with set_model.
+        :param name: The name of the swept model.
+        :param factory: function that receives a number of threads and returns a dictionary with the set_model
+                        parameters, except name, of the codec configured with that number of threads.
+        :param threads: A list with the numbers of threads to sweep. Repeated numbers are swept once.
+        :param num_images: number of images that will be used from dataset for every thread count.
+        :param plot: display a graphs with the speedup and efficiency curves.
+        :param options: The options of benchmark. Leave workers empty, so the threads of the codec don't compete
+                        with other processes. warmup defaults to 1, so the smallest thread count, which is the
+                        baseline of the speedup, doesn't pay the cold start of the sweep.
+        :return: A ScalingResults with the throughput, speedup and efficiency per thread count.
+        """
+        threads = sorted(set(threads))
+        options.setdefault("warmup", 1)
+        models = self.models
+        self.models = {}
+        try:
+            for count in threads:
+                self.set_model("{} ({} threads)".format(name, count), **factory(count))
+            results = self.benchmark(num_images, plot=False, **options)
+        finally:
+            self.models = models
+
+        scaling = ScalingResults(name, threads, results)
+        scaling.report()
+        if plot:
+            scaling.plot()
+        return scaling
@@ -0,0 +1,61 @@
+import numpy as np
+
+
+def image_metrics(shape: tuple, dtype, bit_depth: int = None) -> dict:
+    """
+    This function will describe an original image for the metrics, from its shape and dtype.
+    :param shape: The HxWxC or HxW shape of the image.
+    :param dtype: The dtype of the image.
+    :param bit_depth: number of significant bits of every subpixel, e.g. 10, 12 or 16 for data stored in uint16.
+                      Leave it empty to use every bit of the dtype.
+    :return: A dictionary with the number of subpixels, the number of channels, the size in bytes of the image
+             in memory, the size in bytes of a subpixel and the bit depth.
+    """
+    dtype = np.dtype(dtype)
+    if bit_depth is None:
+        bit_depth = dtype.itemsize * 8
+    elif not 0 < bit_depth <= dtype.itemsize * 8:
+        raise ValueError("A bit depth of {} doesn't fit in {}".format(bit_depth, dtype))
+    subpixels = int(np.prod(shape))
+    return {"pixels": subpixels, "channels": int(shape[-1]) if len(shape) == 3 else 1,
+            "raw_bytes": subpixels * dtype.itemsize, "itemsize": dtype.itemsize, "bit_depth": bit_depth}
+
+
+def bpsp(compressed_bytes, subpixels):
+    """
+    :param compressed_bytes: The compressed size in bytes.
+    :param subpixels: The number of subpixels of the original image.
+    :return: The compression rate in bits per subpixel.
+    """
+    return np.asarray(compressed_bytes) * 8 / subpixels
+
+
+def bpp(compressed_bytes, subpixels, channels):
+    """
+    :param compressed_bytes: The compressed size in bytes.
+    :param subpixels: The number of subpixels of the original image.
+    :param channels: The number of channels of the original image.
+    :return: The compression rate in bits per pixel.
+    """
+    return bpsp(compressed_bytes, subpixels) * channels
+
+
+def compression_ratio(compressed_bytes, subpixels, bit_depth):
+    """
+    The uncompressed size only counts the significant bits, so 12-bit data stored in uint16 isn't credited with
+    the 4 padding bits of every subpixel.
+    :param compressed_bytes: The compressed size in bytes.
+    :param subpixels: The number of subpixels of the original image.
+    :param bit_depth: The bit depth of the original image.
+    :return: The ratio between the uncompressed and the compressed size.
+    """
+    return np.asarray(subpixels) * bit_depth / (np.asarray(compressed_bytes) * 8)
+
+
+def throughput(raw_bytes, time_ns):
+    """
+    :param raw_bytes: The size in bytes of the original image in memory.
+    :param time_ns: The time in nanoseconds.
+    :return: The throughput in MB/s, with 1MB = 10^6 bytes of the original image.
+    """
+    return np.asarray(raw_bytes) * 10 ** 3 / time_ns
@@ -0,0 +1,105 @@
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TimingGate:
+    """
+    A class used to keep background work out of the timed regions.
+    Any number of background tasks can run at once, but entering the gate waits for the running ones to finish
+    and holds back new ones until the timed region exits.
+    """
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.tasks = 0
+        self.timing = False
+
+    def __enter__(self):
+        with self.condition:
+            self.timing = True
+            self.condition.wait_for(lambda: self.tasks == 0)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        with self.condition:
+            self.timing = False
+            self.condition.notify_all()
+
+    def run(self, function, *args):
+        """
+        This function will run a background task outside the timed regions.
+        :param function: The task.
+        :return: The return value of the task.
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: not self.timing)
+            self.tasks += 1
+        try:
+            return function(*args)
+        finally:
+            with self.condition:
+                self.tasks -= 1
+                self.condition.notify_all()
+
+
+class Prefetcher:
+    """
+    A class used to load and preprocess the next images on background threads, through a bounded queue.
+    The timed regions enter the gate, so the setup work never overlaps the timing of the current image.
+    """
+    def __init__(self, prepare, indexes, depth: int = 2, threads: int = 1):
+        """
+        :param prepare: function that receives an image index and returns the prepared image.
+        :param indexes: A list with the indexes of the images, in the order they are consumed.
+        :param depth: maximum number of images prepared ahead. Leave it at 0 to prepare them inline.
+        :param threads: number of background threads.
+        """
+        self.prepare = prepare
+        self.indexes = list(indexes)
+        self.depth = depth
+        self.threads = threads
+        self.gate = TimingGate()
+        self.executor = None
+
+    def __enter__(self):
+        if self.depth > 0:
+            self.executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="llimcobe-prefetch")
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+
+    def __iter__(self):
+        """
+        :return: A generator of (index, prepared image) tuples in the order of the indexes.
+        """
+        if self.executor is None:
+            for index in self.indexes:
+                yield index, self.prepare(index)
+            return
+
+        pending = deque()
+        indexes = iter(self.indexes)
+        for index in indexes:
+            pending.append((index, self.executor.submit(self.gate.run, self.prepare, index)))
+            if len(pending) >= self.depth:
+                break
+        while pending:
+            # The image is taken in another frame, so this one holds no reference to it while it's consumed.
+            yield self.take(pending, indexes)
+
+    def take(self, pending, indexes):
+        """
+        This function will wait for the next prepared image and submit the preparation of the following one.
+        :param pending: A deque with the (index, future) tuples of the images being prepared.
+        :param indexes: An iterator with the indexes of the images not yet submitted.
+        :return: A tuple with the index and the prepared image.
+        """
+        index, future = pending.popleft()
+        prepared = future.result()
+        for next_index in indexes:
+            pending.append((next_index, self.executor.submit(self.gate.run, self.prepare, next_index)))
+            break
+        return index, prepared
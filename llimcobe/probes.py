@@ -0,0 +1,134 @@
+import os
+import sys
+import tracemalloc
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    # resource is only available on Unix, os.times gives the CPU times elsewhere.
+    resource = None
+
+# Keys of a probe sample. CPU times are in nanoseconds, memory in bytes, and all of them are -1 when not measured.
+SAMPLE_KEYS = ("user_ns", "sys_ns", "rss_bytes", "alloc_bytes")
+# ru_maxrss is in bytes on macOS and in kilobytes on the other Unix systems.
+MAXRSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+
+def reset_peak_rss() -> bool:
+    """
+    This function will reset the peak RSS of the process to its current RSS, which Linux supports through
+    /proc/self/clear_refs.
+    :return: True if it was reset.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as fo:
+            fo.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def memory_status() -> dict:
+    """
+    :return: A dictionary with the current (VmRSS) and peak (VmHWM) RSS of the process in bytes, read from
+             /proc/self/status.
+    """
+    status = {}
+    with open("/proc/self/status") as fo:
+        for line in fo:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "VmHWM"):
+                status[key] = int(value.split()[0]) * 1024
+    return status
+
+
+# Where the peak RSS can be reset, every region measures its own peak over the RSS it started with. Elsewhere the
+# lifetime peak of the process is used, which only grows when a region goes over every earlier one.
+RESETTABLE_PEAK_RSS = sys.platform.startswith("linux") and reset_peak_rss()
+
+
+class ResourceProbe:
+    """
+    A class used to measure the resources used by a region: the user and system CPU time of the process,
+    the growth of its peak resident set size over the one it started with (see RESETTABLE_PEAK_RSS) and,
+    optionally, the peak of the Python allocations traced by tracemalloc.
+    Enter it inside the timed region's gate but outside the timer, so its overhead isn't timed.
+    The result of the last region is kept in sample.
+    """
+    def __init__(self, resources: bool = True, allocations: bool = False):
+        """
+        :param resources: measure the CPU times and the peak RSS growth.
+        :param allocations: measure the peak of the Python allocations. It slows every allocation of the region.
+        """
+        self.resources = resources
+        self.allocations = allocations
+        self.sample = dict.fromkeys(SAMPLE_KEYS, -1)
+        self.started = False
+        self.start_usage = None
+        self.start_rss = -1
+        self.start_traced = 0
+
+    def __enter__(self):
+        if self.allocations:
+            self.started = not tracemalloc.is_tracing()
+            if self.started:
+                tracemalloc.start()
+            else:
+                tracemalloc.reset_peak()
+            self.start_traced = tracemalloc.get_traced_memory()[0]
+        if self.resources:
+            self.start_rss = -1
+            if RESETTABLE_PEAK_RSS and reset_peak_rss():
+                self.start_rss = memory_status()["VmRSS"]
+            self.start_usage = usage()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        sample = dict.fromkeys(SAMPLE_KEYS, -1)
+        if self.resources:
+            end_usage = usage()
+            sample["user_ns"] = end_usage[0] - self.start_usage[0]
+            sample["sys_ns"] = end_usage[1] - self.start_usage[1]
+            if self.start_rss >= 0:
+                sample["rss_bytes"] = max(memory_status()["VmHWM"] - self.start_rss, 0)
+            elif end_usage[2] >= 0:
+                sample["rss_bytes"] = end_usage[2] - self.start_usage[2]
+        if self.allocations:
+            sample["alloc_bytes"] = tracemalloc.get_traced_memory()[1] - self.start_traced
+            if self.started:
+                tracemalloc.stop()
+        self.sample = sample
+
+
+def usage():
+    """
+    :return: A tuple with the user and system CPU times of the process in nanoseconds and its peak RSS in bytes,
+             or -1 if it isn't available.
+    """
+    if resource is None:
+        times = os.times()
+        return int(times.user * 10 ** 9), int(times.system * 10 ** 9), -1
+    rusage = resource.getrusage(resource.RUSAGE_SELF)
+    return int(rusage.ru_utime * 10 ** 9), int(rusage.ru_stime * 10 ** 9), rusage.ru_maxrss * MAXRSS_UNIT
+
+
+def share_sample(sample: dict, share: float) -> dict:
+    """
+    This function will apportion the sample of a batch to one of its images.
+    CPU times are split by the share, while memory peaks can't be split and are kept whole.
+    :param sample: The sample of the batch.
+    :param share: The share of the image.
+    :return: The sample of the image.
+    """
+    return {key: value * share if key.endswith("_ns") and value >= 0 else value for key, value in sample.items()}
+
+
+def aggregate_samples(samples: list) -> dict:
+    """
+    This function will aggregate the samples of the repeated runs of an image.
+    :param samples: A list with the samples.
+    :return: A sample with the median CPU times and the maximum memory peaks.
+    """
+    return {key: float(np.median([sample[key] for sample in samples])) if key.endswith("_ns")
+            else int(max(sample[key] for sample in samples)) for key in SAMPLE_KEYS}
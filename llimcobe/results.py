@@ -0,0 +1,369 @@
+import csv
+import json
+import numpy as np
+from llimcobe import metrics
+from llimcobe.stats import bootstrap_ci
+from llimcobe.probes import SAMPLE_KEYS, RESETTABLE_PEAK_RSS
+
+# One row per (model, image). Times are in nanoseconds, batch and I/O times are -1 when they aren't measured.
+# pixels is the number of subpixels and raw_bytes the size in memory of the original image.
+# mismatches is the number of differing pixels, -1 when the compare function doesn't count them.
+# With a batch model encode_ns is the share of the batch time apportioned to the image by its subpixels.
+# encode_codec_ns and decode_codec_ns are the times reported by the codec itself, -1 when it doesn't report them.
+# The user and system CPU times, the peak RSS growth and the Python allocation peak are -1 when they aren't probed.
+RECORD_DTYPE = np.dtype([("model", np.int32), ("image", np.int64),
+                         ("bytes", np.int64), ("pixels", np.int64), ("raw_bytes", np.int64),
+                         ("channels", np.int32), ("itemsize", np.int32), ("bit_depth", np.int32),
+                         ("encode_ns", np.float64), ("decode_ns", np.float64),
+                         ("encode_min_ns", np.float64), ("encode_mean_ns", np.float64), ("encode_std_ns", np.float64),
+                         ("decode_min_ns", np.float64), ("decode_mean_ns", np.float64), ("decode_std_ns", np.float64),
+                         ("batch_ns", np.float64), ("batch_size", np.int32),
+                         ("encode_codec_ns", np.float64), ("decode_codec_ns", np.float64),
+                         ("encode_user_ns", np.float64), ("encode_sys_ns", np.float64),
+                         ("encode_rss_bytes", np.int64), ("encode_alloc_bytes", np.int64),
+                         ("decode_user_ns", np.float64), ("decode_sys_ns", np.float64),
+                         ("decode_rss_bytes", np.int64), ("decode_alloc_bytes", np.int64),
+                         ("write_ns", np.float64), ("read_ns", np.float64),
+                         ("mismatches", np.int64), ("match", np.bool_), ("done", np.bool_)])
+# The fields that describe the result of a (model, image) pair.
+FIELDS = RECORD_DTYPE.names[2:-1]
+# The fields that describe the original image. They are always taken from the dataset.
+IMAGE_FIELDS = ("pixels", "raw_bytes", "channels", "itemsize", "bit_depth")
+# What the peak RSS growth of a region means, see probes.RESETTABLE_PEAK_RSS.
+RSS_DESCRIPTION = ("peak RSS growth over the RSS before each image" if RESETTABLE_PEAK_RSS else
+                   "growth of the lifetime peak RSS of the process, 0 for images below an earlier peak,")
+
+
+class BenchmarkResults:
+    """
+    A class used to hold the per-model, per-image results of a benchmark in a columnar NumPy structured array.
+    """
+    def __init__(self, names: list, num_images: int, options: dict, images: list):
+        """
+        :param names: A list with the names of the benchmarked models.
+        :param num_images: number of images benchmarked with every model.
+        :param options: A dictionary with the options the benchmark was run with.
+        :param images: A list with the metrics.image_metrics dictionary of every image, or None for the images
+                       whose metrics are set with set_image when they are loaded.
+        """
+        self.names = list(names)
+        self.num_images = num_images
+        self.options = options
+        self.records = np.zeros(len(self.names) * num_images, dtype=RECORD_DTYPE)
+        self.records["model"] = np.repeat(np.arange(len(self.names), dtype=np.int32), num_images)
+        self.records["image"] = np.tile(np.arange(num_images, dtype=np.int64), len(self.names))
+        for index, image in enumerate(images):
+            if image is not None:
+                self.set_image(index, image)
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @property
+    def models(self):
+        """
+        :return: A list with the names of the benchmarked models.
+        """
+        return list(self.names)
+
+    def add(self, name: str, index: int, measure: dict):
+        """
+        This function will store the measure of an image.
+        :param name: The name of the model.
+        :param index: The index of the image.
+        :param measure: A dictionary with the measure of the image.
+        """
+        fields = {field: measure[field] for field in ("bytes", "encode_ns", "decode_ns", "batch_ns", "batch_size",
+                                                      "encode_codec_ns", "decode_codec_ns", "write_ns", "read_ns",
+                                                      "mismatches")}
+        for step in ("encode", "decode"):
+            for key in ("min", "mean", "std"):
+                fields["{}_{}_ns".format(step, key)] = measure["{}_stats".format(step)][key]
+            for key in SAMPLE_KEYS:
+                fields["{}_{}".format(step, key)] = measure["{}_{}".format(step, key)]
+        fields["match"] = bool(measure["match"])
+        self.set(name, index, fields)
+
+    def set_image(self, index: int, image: dict):
+        """
+        This function will store the metrics of an original image in the rows of every model.
+        :param index: The index of the image.
+        :param image: A dictionary with a value for the names in IMAGE_FIELDS, see metrics.image_metrics.
+        """
+        rows = self.records[index::self.num_images]
+        for field in IMAGE_FIELDS:
+            rows[field] = image[field]
+
+    def set(self, name: str, index: int, fields: dict):
+        """
+        This function will store the result fields of an image, e.g. read back from a cache.
+        :param name: The name of the model.
+        :param index: The index of the image.
+        :param fields: A dictionary with a value for the names in FIELDS. Missing fields are left at zero,
+                       and the IMAGE_FIELDS are ignored.
+        """
+        row = self.records[self.names.index(name) * self.num_images + index]
+        for field in FIELDS:
+            if field in fields and field not in IMAGE_FIELDS:
+                row[field] = fields[field]
+        row["done"] = True
+
+    def done(self, name: str, index: int) -> bool:
+        """
+        :param name: The name of the model.
+        :param index: The index of the image.
+        :return: True if the result of the image is already stored.
+        """
+        return bool(self.records["done"][self.names.index(name) * self.num_images + index])
+
+    def get(self, name: str, index: int):
+        """
+        :param name: The name of the model.
+        :param index: The index of the image.
+        :return: A dictionary with the result fields of the image as Python scalars.
+        """
+        row = self.records[self.names.index(name) * self.num_images + index]
+        return {field: row[field].item() for field in FIELDS}
+
+    def record(self, name: str, index: int):
+        """
+        :param name: The name of the model.
+        :param index: The index of the image.
+        :return: A dictionary with the model name, the image index, the compressed size in bits, the number of
+                 subpixels, the compression and decompression times in seconds and whether the images match.
+        """
+        row = self.records[self.names.index(name) * self.num_images + index]
+        return {"name": name, "index": index, "bits": int(row["bytes"]) * 8, "pixels": int(row["pixels"]),
+                "encode_s": float(row["encode_ns"]) / 10 ** 9, "decode_s": float(row["decode_ns"]) / 10 ** 9,
+                "match": bool(row["match"])}
+
+    def model_records(self, name: str, finished: bool = False):
+        """
+        :param name: The name of the model.
+        :param finished: only return the rows that are done, e.g. while the benchmark is still running or after it
+                         was interrupted. They are a copy instead of a view.
+        :return: A view of the rows of the model, in dataset order.
+        """
+        start = self.names.index(name) * self.num_images
+        records = self.records[start:start + self.num_images]
+        return records[records["done"]] if finished else records
+
+    def bpsp(self, name: str):
+        """
+        :param name: The name of the model.
+        :return: An array with the compression rate in bits per subpixel of every finished image.
+        """
+        records = self.model_records(name, finished=True)
+        return metrics.bpsp(records["bytes"], records["pixels"])
+
+    def bpp(self, name: str):
+        """
+        :param name: The name of the model.
+        :return: An array with the compression rate in bits per pixel of every finished image.
+        """
+        records = self.model_records(name, finished=True)
+        return metrics.bpp(records["bytes"], records["pixels"], records["channels"])
+
+    def compression_ratio(self, name: str):
+        """
+        :param name: The name of the model.
+        :return: An array with the compression ratio of every finished image, over the significant bits of the original.
+        """
+        records = self.model_records(name, finished=True)
+        return metrics.compression_ratio(records["bytes"], records["pixels"], records["bit_depth"])
+
+    def compression_throughput(self, name: str):
+        """
+        :param name: The name of the model.
+        :return: An array with the compression throughput in MB/s of every finished image, NaN for the images that
+                 weren't compressed, e.g. in decode-only runs.
+        """
+        records = self.model_records(name, finished=True)
+        measured = records["encode_ns"] >= 0
+        return np.where(measured, metrics.throughput(records["raw_bytes"], np.where(measured, records["encode_ns"], 1)),
+                        np.nan)
+
+    def decompression_throughput(self, name: str):
+        """
+        :param name: The name of the model.
+        :return: An array with the decompression throughput in MB/s of every finished image.
+        """
+        records = self.model_records(name, finished=True)
+        return metrics.throughput(records["raw_bytes"], records["decode_ns"])
+
+    def percentiles(self, name: str, metric: str, q=(5, 25, 50, 75, 95)):
+        """
+        :param name: The name of the model.
+        :param metric: "bpsp", "bpp", "compression_ratio", "compression_throughput" or "decompression_throughput".
+        :param q: The percentiles to compute.
+        :return: An array with the percentiles of the metric.
+        """
+        return np.percentile(getattr(self, metric)(name), q)
+
+    def summary(self):
+        """
+        This function will aggregate the finished results of every model.
+        :return: A dictionary per model with the mean bpsp and bpp, the ratio between the total uncompressed and
+                 compressed sizes, the mean throughputs and their 95% confidence intervals. The compression
+                 throughput and its interval are None in decode-only runs, and every value is None for models
+                 without finished images.
+        """
+        decode_only = self.options.get("decode_only", False)
+        summary = {}
+        for name in self.names:
+            throughput = self.compression_throughput(name)
+            dthroughput = self.decompression_throughput(name)
+            records = self.model_records(name, finished=True)
+            if not len(records):
+                # Nothing is finished yet, e.g. right after the benchmark starts.
+                summary[name] = dict.fromkeys(("bpsp", "bpp", "compression_ratio", "compression_throughput",
+                                               "compression_throughput_ci", "decompression_throughput",
+                                               "decompression_throughput_ci"))
+                continue
+            summary[name] = {"bpsp": float(self.bpsp(name).mean()), "bpp": float(self.bpp(name).mean()),
+                             "compression_ratio": float((records["pixels"] * records["bit_depth"]).sum() /
+                                                        (records["bytes"].sum() * 8)),
+                             "compression_throughput": None if decode_only else float(throughput.mean()),
+                             "compression_throughput_ci": None if decode_only else bootstrap_ci(throughput),
+                             "decompression_throughput": float(dthroughput.mean()),
+                             "decompression_throughput_ci": bootstrap_ci(dthroughput)}
+        return summary
+
+    def save(self, path: str):
+        """
+        This function will save the results, in a format chosen by the extension of the path.
+        .csv and .json files have a row per (model, image) with the model name, .json files also have the options
+        and the summary, and .npz files have the model names and the records, like a checkpoint.
+        :param path: The path of the .csv, .json or .npz file.
+        """
+        names = np.asarray(self.names)[self.records["model"]]
+        if path.endswith(".npz"):
+            np.savez(path, names=np.array(self.names, dtype=str), records=self.records)
+        elif path.endswith(".csv"):
+            with open(path, "w", newline="") as fo:
+                writer = csv.writer(fo)
+                writer.writerow(("model",) + RECORD_DTYPE.names[1:])
+                for name, record in zip(names, self.records):
+                    writer.writerow((name,) + record.item()[1:])
+        elif path.endswith(".json"):
+            records = [dict(zip(("model",) + RECORD_DTYPE.names[1:], (str(name),) + record.item()[1:]))
+                       for name, record in zip(names, self.records)]
+            with open(path, "w") as fo:
+                json.dump({"options": self.options, "summary": self.summary(), "records": records}, fo, indent=1)
+        else:
+            raise ValueError("Unknown results format: {}".format(path))
+
+    def report(self):
+        """
+        This function will print the results of every model.
+        """
+        summary = self.summary()
+        # Decode-only runs have no compression times.
+        decode_only = self.options.get("decode_only", False)
+        if self.options.get("cache"):
+            print('The result cache had {} hits and {} misses'.format(self.cache_hits, self.cache_misses))
+        for name in self.names:
+            records = self.model_records(name, finished=True)
+            if not len(records):
+                print('{} model have no finished images'.format(name))
+                continue
+            print('{} model have a compression rate of {}bpsp ({}bpp, ratio {})'.format(
+                name, summary[name]["bpsp"], summary[name]["bpp"], summary[name]["compression_ratio"]))
+            if not decode_only:
+                print('{} model have a compression throughput of {}MB/s (95% CI {}-{}MB/s)'.format(
+                    name, summary[name]["compression_throughput"], *summary[name]["compression_throughput_ci"]))
+            print('{} model have a decompression throughput of {}MB/s (95% CI {}-{}MB/s)'.format(
+                name, summary[name]["decompression_throughput"], *summary[name]["decompression_throughput_ci"]))
+            for step, label in (("encode", "compressing"), ("decode", "decompressing")):
+                cpu = records[records["{}_user_ns".format(step)] >= 0]
+                if len(cpu):
+                    print('{} model have a CPU time of {}s user and {}s system {}'.format(
+                        name, cpu["{}_user_ns".format(step)].sum() / 10 ** 9,
+                        cpu["{}_sys_ns".format(step)].sum() / 10 ** 9, label))
+                for key, description in (("rss", RSS_DESCRIPTION), ("alloc", "Python allocation peak")):
+                    peaks = records["{}_{}_bytes".format(step, key)]
+                    if (peaks >= 0).any():
+                        print('{} model have a maximum {} of {}MB {}'.format(
+                            name, description, peaks.max() / 10 ** 6, label))
+            if self.options["repeats"] > 1:
+                # The per-image statistics are in records, only their medians are printed.
+                for step, label in (("encode", "compression"), ("decode", "decompression"))[decode_only:]:
+                    print('{} model have a median per-image {} time std of {}s over {} repeats ({}% of the median '
+                          'time)'.format(name, label, np.median(records["{}_std_ns".format(step)]) / 10 ** 9,
+                                         self.options["repeats"],
+                                         np.median(records["{}_std_ns".format(step)] / records["{}_ns".format(step)])
+                                         * 100))
+            if (records["batch_size"] > 1).any() and not decode_only:
+                print('{} model have a batch compression throughput of {}MB/s in batches of up to {} images'.format(
+                    name, metrics.throughput(records["raw_bytes"].sum(), records["encode_ns"].sum()),
+                    records["batch_size"].max()))
+            if (records["encode_codec_ns"] >= 0).any() or (records["decode_codec_ns"] >= 0).any():
+                for step, label in (("encode", "compressing"), ("decode", "decompressing")):
+                    reported = records[records["{}_codec_ns".format(step)] >= 0]
+                    wall = reported["{}_ns".format(step)].sum()
+                    codec = reported["{}_codec_ns".format(step)].sum()
+                    print('{} model have a codec-reported time of {}s {}, {}s of wrapper overhead ({}%)'.format(
+                        name, codec / 10 ** 9, label, (wall - codec) / 10 ** 9,
+                        (wall - codec) * 100 / wall if wall else 0))
+            if self.options["in_memory"] and not decode_only:
+                print('{} model have a codec time of {}s compressing and {}s decompressing'.format(
+                    name, records["encode_ns"].sum() / 10 ** 9, records["decode_ns"].sum() / 10 ** 9))
+                print('{} model have an I/O time of {}s writing and {}s reading'.format(
+                    name, records["write_ns"].sum() / 10 ** 9, records["read_ns"].sum() / 10 ** 9))
+
+    def plot(self, show: bool = True):
+        """
+        This function will display a graphs with the results.
+        matplotlib is only imported here, so benchmarks without plots don't need it.
+        :param show: call matplotlib.pyplot.show() once the graphs are drawn.
+        :return: The matplotlib figure.
+        """
+        import matplotlib.pyplot as plt
+
+        fig, axs = plt.subplots(2, 3)
+        summary = self.summary()
+
+        for name in self.names:
+            axs[0, 0].plot(np.sort(self.bpsp(name)), label=name)
+        axs[0, 0].legend()
+        axs[0, 0].set(xlabel="Sorted Images Index", ylabel="Compression Rate [bpsp]")
+
+        for name in self.names:
+            axs[0, 1].plot(np.sort(self.compression_throughput(name)), label=name)
+        axs[0, 1].legend()
+        axs[0, 1].set(xlabel="Sorted Images Index", ylabel="Compression Throughput [MB/s]", ylim=0.01, yscale="log")
+
+        for name in self.names:
+            axs[0, 2].plot(np.sort(self.decompression_throughput(name)), label=name)
+        axs[0, 2].legend()
+        axs[0, 2].set(xlabel="Sorted Images Index", ylabel="Decompression Throughput [MB/s]", ylim=0.01, yscale="log")
+
+        markers = ['o', 'v', '^', '<', '>', '8', 's', 'p', '*', 'h', 'H', 'D', 'd', 'P', 'X']
+
+        fig.delaxes(axs[1, 0])
+
+        decode_only = self.options.get("decode_only", False)
+        if not decode_only:
+            for ix, name in enumerate(self.names):
+                if summary[name]["bpsp"] is not None:
+                    axs[1, 1].scatter(summary[name]["bpsp"], summary[name]["compression_throughput"], label=name,
+                                      marker=markers[ix % len(markers)])
+            axs[1, 1].legend()
+        axs[1, 1].set(xlabel="Compression Rate [bpsp]", ylabel="Compression Throughput [MB/s]", ylim=0.01, xlim=0,
+                      yscale="log")
+
+        for ix, name in enumerate(self.names):
+            if summary[name]["bpsp"] is not None:
+                axs[1, 2].scatter(summary[name]["bpsp"], summary[name]["decompression_throughput"], label=name,
+                                  marker=markers[ix % len(markers)])
+        axs[1, 2].legend()
+        axs[1, 2].set(xlabel="Compression Rate [bpsp]", ylabel="Decompression Throughput [MB/s]", ylim=0.01, xlim=0,
+                      yscale="log")
+
+        if decode_only:
+            # Decode-only runs have no compression times.
+            fig.delaxes(axs[0, 1])
+            fig.delaxes(axs[1, 1])
+
+        if show:
+            plt.show()
+        return fig
@@ -0,0 +1,81 @@
+import numpy as np
+from llimcobe import metrics
+
+
+class ScalingResults:
+    """
+    A class used to hold the results of a thread-count sweep of a model, with its throughput, speedup and efficiency
+    curves. The speedup and efficiency are relative to the smallest thread count.
+    """
+    def __init__(self, name: str, threads: list, results):
+        """
+        :param name: The name of the swept model.
+        :param threads: A list with the swept thread counts, in increasing order.
+        :param results: The BenchmarkResults of the sweep, with a model per thread count.
+        """
+        self.name = name
+        self.threads = list(threads)
+        self.results = results
+
+    def throughput(self, metric: str = "compression_throughput"):
+        """
+        :param metric: "compression_throughput" or "decompression_throughput".
+        :return: An array with the aggregate throughput in MB/s per thread count, as the total raw bytes over the
+                 total time, so large images weigh more than small ones.
+        """
+        step = "encode" if metric == "compression_throughput" else "decode"
+        throughputs = []
+        for name in self.results.names:
+            records = self.results.model_records(name, finished=True)
+            throughputs.append(metrics.throughput(records["raw_bytes"].sum(), records["{}_ns".format(step)].sum()))
+        return np.asarray(throughputs)
+
+    def speedup(self, metric: str = "compression_throughput"):
+        """
+        :param metric: "compression_throughput" or "decompression_throughput".
+        :return: An array with the speedup per thread count over the smallest thread count.
+        """
+        throughput = self.throughput(metric)
+        return throughput / throughput[0]
+
+    def efficiency(self, metric: str = "compression_throughput"):
+        """
+        :param metric: "compression_throughput" or "decompression_throughput".
+        :return: An array with the parallel efficiency per thread count, the speedup over the ideal one.
+        """
+        return self.speedup(metric) * self.threads[0] / np.asarray(self.threads)
+
+    def report(self):
+        """
+        This function will print the scaling curves.
+        """
+        for metric, label in (("compression_throughput", "compression"), ("decompression_throughput", "decompression")):
+            for threads, throughput, speedup, efficiency in zip(self.threads, self.throughput(metric),
+                                                                self.speedup(metric), self.efficiency(metric)):
+                print('{} model with {} threads have a {} throughput of {}MB/s, a speedup of {} '
+                      'and an efficiency of {}'.format(self.name, threads, label, throughput, speedup, efficiency))
+
+    def plot(self, show: bool = True):
+        """
+        This function will display a graphs with the speedup and efficiency curves.
+        matplotlib is only imported here, so sweeps without plots don't need it.
+        :param show: call matplotlib.pyplot.show() once the graphs are drawn.
+        :return: The matplotlib figure.
+        """
+        import matplotlib.pyplot as plt
+
+        fig, axs = plt.subplots(1, 2)
+        threads = np.asarray(self.threads)
+
+        for metric, label in (("compression_throughput", "Compression"), ("decompression_throughput", "Decompression")):
+            axs[0].plot(threads, self.speedup(metric), marker="o", label=label)
+            axs[1].plot(threads, self.efficiency(metric), marker="o", label=label)
+        axs[0].plot(threads, threads / threads[0], linestyle="--", color="gray", label="Ideal")
+        axs[0].legend()
+        axs[0].set(xlabel="Threads", ylabel="Speedup", title=self.name)
+        axs[1].legend()
+        axs[1].set(xlabel="Threads", ylabel="Efficiency", ylim=(0, 1.1), title=self.name)
+
+        if show:
+            plt.show()
+        return fig
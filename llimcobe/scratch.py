@@ -0,0 +1,59 @@
+import os
+import re
+import shutil
+import tempfile
+import zlib
+
+
+def safe_name(name: str) -> str:
+    """
+    This function will turn a model name into a unique file name.
+    :param name: The name of the model.
+    :return: The name with the characters that aren't safe in file names replaced, followed by the CRC32 of the
+             name, so names that only differ in the replaced characters don't collide.
+    """
+    return "{}-{:08x}".format(re.sub(r"[^\w.-]", "_", name), zlib.crc32(name.encode()))
+
+
+class ScratchSpace:
+    """
+    A class used to hand out unique scratch files where the models save the compressed images.
+    Every benchmark run gets its own directory, removed when the run ends, even if it raises an exception.
+    """
+    def __init__(self, directory: str = None):
+        """
+        :param directory: directory where the scratch directories are created, e.g. a tmpfs mount like /dev/shm.
+                          Leave it at None to use the system temporary directory.
+        """
+        self.directory = directory
+        self.root = None
+
+    def __enter__(self):
+        if self.root is None:
+            if self.directory and not os.path.exists(self.directory):
+                os.makedirs(self.directory)
+            self.root = tempfile.mkdtemp(prefix="llimcobe-", dir=self.directory)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cleanup()
+
+    def path(self, worker: int, name: str, index: int) -> str:
+        """
+        This function will return a scratch path unique to a worker, model and image.
+        :param worker: The identifier of the worker, e.g. its process id.
+        :param name: The name of the model.
+        :param index: The index of the image.
+        :return: The scratch path.
+        """
+        if self.root is None:
+            raise RuntimeError("The scratch space must be entered before asking for paths")
+        return os.path.join(self.root, "{}-{}-{}".format(worker, safe_name(name), index))
+
+    def cleanup(self):
+        """
+        This function will delete the scratch directory and everything left inside it.
+        """
+        if self.root is not None:
+            shutil.rmtree(self.root, ignore_errors=True)
+            self.root = None
@@ -0,0 +1,36 @@
+import numpy as np
+
+
+def timing_stats(times):
+    """
+    This function will summarise the repeated timings of an image.
+    :param times: A list with the elapsed times in nanoseconds.
+    :return: A dictionary with the min, median, mean and standard deviation of the times.
+    """
+    times = np.asarray(times, dtype=np.float64)
+    return {"min": float(times.min()), "median": float(np.median(times)),
+            "mean": float(times.mean()), "std": float(times.std())}
+
+
+def bootstrap_ci(values, confidence: float = 0.95, resamples: int = 1000, seed: int = 0, chunk_size: int = 1 << 20):
+    """
+    This function will compute a bootstrap confidence interval of the mean of some values.
+    :param values: A list with the values, e.g. the throughput of every image.
+    :param confidence: The confidence level of the interval.
+    :param resamples: The number of bootstrap resamples.
+    :param seed: The seed of the random generator, so intervals are reproducible.
+    :param chunk_size: maximum number of resampled values drawn at once.
+    :return: A tuple with the lower and upper bounds of the interval.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if values.size < 2:
+        mean = float(values.mean()) if values.size else float("nan")
+        return mean, mean
+    rng = np.random.default_rng(seed)
+    # The resamples are drawn a few at a time, so the index matrix stays bounded for large datasets.
+    chunk = max(1, chunk_size // values.size)
+    means = np.concatenate([values[rng.integers(0, values.size, (min(chunk, resamples - start), values.size))]
+                            .mean(axis=1) for start in range(0, resamples, chunk)])
+    alpha = (1 - confidence) / 2
+    low, high = np.quantile(means, [alpha, 1 - alpha])
+    return float(low), float(high)
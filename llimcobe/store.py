@@ -0,0 +1,132 @@
+import hashlib
+import io
+import os
+import shutil
+import sqlite3
+import time
+
+
+class ArtifactStore:
+    """
+    A class used to keep compressed images in a content-addressed directory, keyed by model name, model version and
+    image content hash, so later runs can decompress them without compressing the images again.
+    The store is capped in size, and the least recently used artifacts are evicted first.
+    """
+    def __init__(self, directory: str, max_bytes: int = None):
+        """
+        :param directory: The store directory. It is created if it doesn't exist.
+        :param max_bytes: maximum total size in bytes of the stored artifacts. Leave it at None for no cap.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(directory, "index.db"), timeout=60)
+        # WAL lets the worker processes use the store at the same time.
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS artifacts (digest TEXT PRIMARY KEY, model TEXT, "
+                                "version TEXT, image TEXT, size INTEGER, last_used REAL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS artifacts_last_used ON artifacts (last_used)")
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @staticmethod
+    def digest(name: str, version: str, key: str) -> str:
+        """
+        :param name: The name of the model.
+        :param version: The version of the model.
+        :param key: The content hash of the image.
+        :return: The address of the artifact.
+        """
+        return hashlib.blake2b("{}\0{}\0{}".format(name, version or "", key).encode(), digest_size=16).hexdigest()
+
+    def path(self, digest: str) -> str:
+        """
+        :param digest: The address of the artifact.
+        :return: The path of the artifact.
+        """
+        return os.path.join(self.directory, digest[:2], digest[2:])
+
+    def find(self, name: str, version: str, key: str) -> str:
+        """
+        This function will look for an artifact and mark it as recently used.
+        :param name: The name of the model.
+        :param version: The version of the model.
+        :param key: The content hash of the image.
+        :return: The path of the artifact.
+        """
+        digest = self.digest(name, version, key)
+        path = self.path(digest)
+        with self.connection:
+            found = self.connection.execute("UPDATE artifacts SET last_used = ? WHERE digest = ?",
+                                            (time.time(), digest)).rowcount
+        if not found or not os.path.exists(path):
+            raise FileNotFoundError("The store has no artifact of the {} model, version {}, for image {}".format(
+                name, version, key))
+        return path
+
+    def put(self, name: str, version: str, key: str, source):
+        """
+        This function will store an artifact, replacing the previous one atomically, and evict the least recently
+        used artifacts if the store goes over its cap.
+        :param name: The name of the model.
+        :param version: The version of the model.
+        :param key: The content hash of the image.
+        :param source: The path or the BytesIO buffer the model saved the compressed image to.
+        """
+        digest = self.digest(name, version, key)
+        path = self.path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp = "{}.{}.tmp".format(path, os.getpid())
+        if isinstance(source, io.BytesIO):
+            with open(temp, "wb") as fo:
+                fo.write(source.getbuffer())
+        else:
+            shutil.copyfile(source, temp)
+        size = os.path.getsize(temp)
+        os.replace(temp, path)
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?, ?, ?)",
+                                    (digest, name, version or "", key, size, time.time()))
+        if self.max_bytes is not None:
+            self.evict(self.max_bytes)
+
+    def evict(self, max_bytes: int):
+        """
+        This function will delete the least recently used artifacts until the store fits in a size.
+        :param max_bytes: The size in bytes the store must fit in.
+        """
+        with self.connection:
+            total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM artifacts").fetchone()[0]
+            if total <= max_bytes:
+                return
+            rows = self.connection.execute("SELECT digest, size FROM artifacts ORDER BY last_used").fetchall()
+            evicted = []
+            for digest, size in rows:
+                if total <= max_bytes:
+                    break
+                evicted.append((digest,))
+                total -= size
+            self.connection.executemany("DELETE FROM artifacts WHERE digest = ?", evicted)
+        for digest, in evicted:
+            try:
+                os.remove(self.path(digest))
+            except FileNotFoundError:
+                # Another process evicted it at the same time.
+                pass
+
+    def size(self) -> int:
+        """
+        :return: The total size in bytes of the stored artifacts.
+        """
+        return self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM artifacts").fetchone()[0]
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
@@ -0,0 +1,117 @@
+import numpy as np
+from llimcobe.dataset import Dataset, image_formats
+from llimcobe.metrics import image_metrics
+from llimcobe.results import BenchmarkResults
+
+
+def tile_starts(length: int, tile: int, overlap: int = 0):
+    """
+    This function will compute where the tiles of an image axis start.
+    :param length: The length of the axis.
+    :param tile: The length of a tile. The last tile is clipped at the border.
+    :param overlap: number of pixels shared by two consecutive tiles.
+    :return: A list with the start of every tile.
+    """
+    stride = tile - overlap
+    return list(range(0, max(length - tile, 0) + stride, stride))
+
+
+class TiledDataset(Dataset):
+    """
+    A dataset with the tiles of the images of another dataset, so large images are benchmarked tile by tile.
+    Tiles are sliced when they are loaded, so over memory-mapped images, e.g. a MemmapDataset or an NpyDataset with
+    mmap, only the tile being benchmarked is read. Use aggregate to turn the results of the tiles back into results of
+    the images.
+    """
+    def __init__(self, dataset, tile_shape: tuple, overlap: int = 0):
+        """
+        :param dataset: A Dataset that reads the format of its images from metadata, e.g. a MemmapDataset or an
+                        NpyDataset, or a list of images in HxWxC numpy.ndarray format.
+        :param tile_shape: The height and width of the tiles. Use the width of the images for strips.
+        :param overlap: number of pixels shared by two neighbouring tiles.
+        """
+        if not 0 <= overlap < min(tile_shape):
+            raise ValueError("The overlap must be smaller than the tiles")
+        self.dataset = dataset
+        self.tile_shape = tuple(tile_shape)
+        self.overlap = overlap
+        self.formats = image_formats(dataset, len(dataset))
+        if None in self.formats:
+            raise ValueError("The tiles are computed from the image formats, so the dataset must implement format")
+        tiles = []
+        for image, (shape, _) in enumerate(self.formats):
+            for y in tile_starts(shape[0], self.tile_shape[0], overlap):
+                for x in tile_starts(shape[1], self.tile_shape[1], overlap):
+                    tiles.append((image, y, x))
+        # One row per tile with the index of its image and the position of its top left corner.
+        self.tiles = np.array(tiles, dtype=np.int64).reshape(-1, 3)
+
+    def __len__(self):
+        return len(self.tiles)
+
+    def tile_shape_of(self, index):
+        """
+        :param index: The index of the tile.
+        :return: The shape of the tile, clipped at the border of its image.
+        """
+        image, y, x = (int(value) for value in self.tiles[index])
+        shape = self.formats[image][0]
+        return (min(self.tile_shape[0], shape[0] - y), min(self.tile_shape[1], shape[1] - x)) + tuple(shape[2:])
+
+    def load(self, index):
+        image, y, x = (int(value) for value in self.tiles[index])
+        return self.dataset[image][y:y + self.tile_shape[0], x:x + self.tile_shape[1]]
+
+    def size(self, index):
+        return int(np.prod(self.tile_shape_of(index)))
+
+    def format(self, index):
+        return self.tile_shape_of(index), self.formats[self.tiles[index][0]][1]
+
+    def aggregate(self, results):
+        """
+        This function will aggregate the results of the tiles into results of their images.
+        The sizes and times of the tiles are added up, while the subpixels and raw bytes are the ones of the image,
+        so the cost of the overlap shows up in the rate and the throughput. Repeated timing statistics are added up
+        too, and the standard deviations are added in quadrature. Memory peaks are the maximum of the tiles, and an
+        image only matches if all its tiles do. Images whose tiles weren't all benchmarked are left out.
+        :param results: The BenchmarkResults of a benchmark over this dataset.
+        :return: A BenchmarkResults with a row per (model, image). Its summary gives the per-dataset metrics.
+        """
+        # The benchmark runs over the first tiles, so the complete images are the ones whose last tile was run.
+        ends = np.cumsum(np.bincount(self.tiles[:, 0], minlength=len(self.formats)))
+        num_images = int(np.searchsorted(ends, results.num_images, side="right"))
+        images = [image_metrics(shape, dtype, results.options.get("bit_depth"))
+                  for shape, dtype in self.formats[:num_images]]
+        aggregated = BenchmarkResults(results.names, num_images, results.options, images)
+        aggregated.cache_hits = results.cache_hits
+        aggregated.cache_misses = results.cache_misses
+        tiles = self.tiles[:ends[num_images - 1] if num_images else 0, 0]
+
+        for name in results.names:
+            records = results.model_records(name)[:len(tiles)]
+            rows = aggregated.model_records(name)
+
+            def total(field):
+                # Fields that aren't measured are -1, and stay -1 if any tile of the image misses them.
+                values = records[field]
+                missing = np.bincount(tiles, values < 0, minlength=num_images) > 0
+                return np.where(missing, -1, np.bincount(tiles, values, minlength=num_images))
+
+            for field in ("bytes", "encode_ns", "decode_ns", "encode_min_ns", "encode_mean_ns", "decode_min_ns",
+                          "decode_mean_ns", "encode_codec_ns", "decode_codec_ns", "encode_user_ns", "encode_sys_ns",
+                          "decode_user_ns", "decode_sys_ns", "write_ns", "read_ns"):
+                rows[field] = total(field)
+            for field in ("encode_std_ns", "decode_std_ns"):
+                missing = np.bincount(tiles, records[field] < 0, minlength=num_images) > 0
+                rows[field] = np.where(missing, -1, np.sqrt(np.bincount(tiles, records[field] ** 2,
+                                                                        minlength=num_images)))
+            for field in ("encode_rss_bytes", "encode_alloc_bytes", "decode_rss_bytes", "decode_alloc_bytes"):
+                rows[field] = -1
+                np.maximum.at(rows[field], tiles, records[field])
+            rows["mismatches"] = total("mismatches")
+            rows["match"] = np.bincount(tiles, ~records["match"], minlength=num_images) == 0
+            rows["batch_ns"] = -1
+            rows["batch_size"] = 1
+            rows["done"] = np.bincount(tiles, ~records["done"], minlength=num_images) == 0
+        return aggregated
@@ -0,0 +1,75 @@
+import numpy as np
+
+
+class Verification:
+    """
+    A class used to hold the outcome of a lossless verification. It is truthy when the images match.
+    """
+    def __init__(self, match: bool, reason: str = "", mismatches: int = 0, first_mismatch: tuple = None):
+        """
+        :param match: True if the images are identical.
+        :param reason: A description of the mismatch.
+        :param mismatches: number of pixels with at least one different subpixel, or -1 if they weren't compared.
+        :param first_mismatch: The index of the first different subpixel, or None.
+        """
+        self.match = match
+        self.reason = reason
+        self.mismatches = mismatches
+        self.first_mismatch = first_mismatch
+
+    def __bool__(self):
+        return self.match
+
+    def __str__(self):
+        return "match" if self.match else self.reason
+
+
+def compare_arrays(original, decoded, chunk_size: int = 1 << 24) -> Verification:
+    """
+    This function will check that two ndarray-like images are identical.
+    The dtype and shape are checked first, then the raw buffers are compared in chunks, so the temporary memory is
+    bounded. Only if a chunk differs, the differing pixels are counted and located.
+    :param original: The original image.
+    :param decoded: The decompressed image.
+    :param chunk_size: number of bytes compared at once.
+    :return: A Verification with the outcome.
+    """
+    original = np.asarray(original)
+    decoded = np.asarray(decoded)
+    if original.dtype != decoded.dtype:
+        return Verification(False, "dtype {} != {}".format(original.dtype, decoded.dtype), -1)
+    if original.shape != decoded.shape:
+        return Verification(False, "shape {} != {}".format(original.shape, decoded.shape), -1)
+
+    original_bytes = np.ascontiguousarray(original).reshape(-1).view(np.uint8)
+    decoded_bytes = np.ascontiguousarray(decoded).reshape(-1).view(np.uint8)
+    for start in range(0, original_bytes.size, chunk_size):
+        if not np.array_equal(original_bytes[start:start + chunk_size], decoded_bytes[start:start + chunk_size]):
+            break
+    else:
+        return Verification(True)
+
+    # The subpixels are compared by their bytes, so e.g. 0.0 and -0.0 differ while NaNs with the same bits don't.
+    different = (original_bytes != decoded_bytes).reshape(-1, original.dtype.itemsize).any(axis=1)
+    different = different.reshape(original.shape)
+    if original.ndim == 3:
+        different_pixels = different.any(axis=-1)
+    else:
+        different_pixels = different
+    first_mismatch = tuple(int(ix) for ix in np.unravel_index(np.flatnonzero(different)[0], original.shape))
+    mismatches = int(np.count_nonzero(different_pixels))
+    return Verification(False, "{} different pixels, the first one at {}".format(mismatches, first_mismatch),
+                        mismatches, first_mismatch)
+
+
+def default_compare(original, decoded):
+    """
+    This function is the compare function used when a model doesn't set one.
+    ndarray images are checked with compare_arrays, the rest with ==.
+    :param original: The preprocessed original image.
+    :param decoded: The preprocessed decompressed image.
+    :return: A Verification for ndarray images, otherwise the result of ==.
+    """
+    if isinstance(original, np.ndarray) or isinstance(decoded, np.ndarray):
+        return compare_arrays(original, decoded)
+    return original == decoded
@@ -7,4 +7,5 @@ setup(
     license='MIT',
     install_requires=['matplotlib', 'numpy', 'typing'],
     setup_reqires=['matplotlib', 'numpy', 'typing'],
+    entry_points={'console_scripts': ['llimcobe = llimcobe.cli:main']},
 )
\ No newline at end of file
@@ -1,4 +1,20 @@
 from llimcobe.llimcobe import Llimcobe as LCB
+from llimcobe.adapters import adapter, buffer_codec
+from llimcobe.dataset import Dataset, MemmapDataset
+from llimcobe.verify import compare_arrays
+from llimcobe.store import ArtifactStore
+from llimcobe.tiling import TiledDataset
+from llimcobe.cli import main
+from llimcobe.probes import RESETTABLE_PEAK_RSS
+from llimcobe.stats import bootstrap_ci
+import csv
+import io
+import json
+import multiprocessing
+import os
+import weakref
+import zlib
+import pytest
 import numpy as np
 
 
@@ -14,3 +30,480 @@ class Test(LCB):
 def test_execution():
     test = Test()
     assert test is not None
+
+
+def test_headless_benchmark():
+    test = Test()
+
+    def save(image, path):
+        with open(path, "wb") as fo:
+            np.save(fo, image)
+
+    test.set_model("npy", model=None, preprocess=lambda image: image, save=save, load=np.load, compare=np.array_equal)
+    results = test.benchmark(5, plot=False)
+    assert results.models == ["npy"]
+    assert len(results.bpsp("npy")) == 5
+    assert all(throughput > 0 for throughput in results.compression_throughput("npy"))
+
+
+def test_default_compare_reports_mismatch():
+    test = Test()
+
+    def save(image, path):
+        with open(path, "wb") as fo:
+            np.save(fo, image.astype(np.float32))
+
+    def load(path):
+        return np.load(path).astype(np.float64)
+
+    test.set_model("lossy", model=None, preprocess=lambda image: image, save=save, load=load, compare=None)
+    with pytest.warns(UserWarning, match="different pixels"):
+        results = test.benchmark(3, plot=False)
+    assert not results.records["match"].any()
+    assert (results.records["mismatches"] > 0).all()
+
+
+def test_hash_verification():
+    test = Test()
+
+    def save(image, path):
+        with open(path, "wb") as fo:
+            np.save(fo, image)
+
+    test.set_model("npy", model=None, preprocess=lambda image: image, save=save, load=np.load, compare=None)
+    test.set_model("lossy", model=None, preprocess=lambda image: image, save=save,
+                   load=lambda path: np.load(path) / 2, compare=None)
+    with pytest.warns(UserWarning, match="hash"):
+        results = test.benchmark(3, plot=False, verify="hash")
+    assert results.records["match"][results.records["model"] == 0].all()
+    assert not results.records["match"][results.records["model"] == 1].any()
+
+
+def test_buffer_codec_adapter():
+    test = Test()
+    test.set_model("zlib", **buffer_codec("zlib"))
+    results = test.benchmark(3, plot=False, in_memory=True)
+    assert results.records["match"].all()
+    # The library version keys the cache and the artifact store.
+    assert zlib.ZLIB_RUNTIME_VERSION in buffer_codec("zlib")["version"]
+
+
+def test_hash_verification_releases_originals():
+    test = Test()
+    saved = []
+
+    def save(image, path):
+        saved.append(weakref.ref(image))
+        with open(path, "wb") as fo:
+            np.save(fo, image)
+
+    def load(path):
+        # The image being decompressed is the last one saved, prefetched images may still be alive.
+        assert saved[-1]() is None
+        return np.load(path)
+
+    test.set_model("npy", model=None, preprocess=lambda image: image.copy(), save=save, load=load, compare=None)
+    for prefetch in (0, 2):
+        results = test.benchmark(4, plot=False, verify="hash", prefetch=prefetch)
+        assert results.records["match"].all()
+
+
+def test_lazy_dataset_loads_each_image_once():
+    loads = []
+
+    class Images(Dataset):
+        def __len__(self):
+            return 4
+
+        def load(self, index):
+            loads.append(index)
+            return np.full((8, 6, 3), index, dtype=np.uint8)
+
+        def size(self, index):
+            return 8 * 6 * 3
+
+    class LazyTest(LCB):
+        def prepare_dataset(self):
+            return Images()
+
+    test = LazyTest()
+    test.set_model("zlib", **buffer_codec("zlib"))
+    results = test.benchmark(4, plot=False)
+    assert loads == [0, 1, 2, 3]
+    assert (results.records["pixels"] == 8 * 6 * 3).all()
+
+
+def test_compare_arrays_signed_zero():
+    original = np.zeros((3, 4, 2))
+    decoded = original.copy()
+    decoded[1, 2, 1] = -0.0
+    verification = compare_arrays(original, decoded)
+    assert not verification
+    assert verification.mismatches == 1
+    assert verification.first_mismatch == (1, 2, 1)
+
+
+def test_result_cache(tmp_path):
+    test = Test()
+    preprocessed = []
+
+    def preprocess(image):
+        preprocessed.append(image)
+        return image
+
+    test.set_model("zlib", **dict(buffer_codec("zlib"), preprocess=preprocess))
+    cache = str(tmp_path / "results.db")
+    first = test.benchmark(3, plot=False, cache=cache)
+    assert (first.cache_hits, first.cache_misses) == (0, 3)
+    preprocessed.clear()
+    for workers in (None, 2):
+        second = test.benchmark(3, plot=False, cache=cache, workers=workers)
+        assert (second.cache_hits, second.cache_misses) == (3, 0)
+        assert (second.records["encode_ns"] == first.records["encode_ns"]).all()
+    # Cached images are not preprocessed, and other timing options don't reuse the results.
+    assert not preprocessed
+    third = test.benchmark(3, plot=False, cache=cache, in_memory=True)
+    assert (third.cache_hits, third.cache_misses) == (0, 3)
+
+
+def test_decode_only_round_trip(tmp_path):
+    test = Test()
+    test.set_model("zlib", **buffer_codec("zlib"))
+    archive = str(tmp_path / "bitstreams")
+    encoded = test.benchmark(3, plot=False, archive=archive)
+    decoded = test.benchmark(3, plot=False, archive=archive, decode_only=True)
+    assert (decoded.records["bytes"] == encoded.records["bytes"]).all()
+    assert decoded.records["match"].all()
+    assert (decoded.records["encode_ns"] == -1).all()
+    summary = decoded.summary()["zlib"]
+    assert summary["compression_throughput"] is None and summary["decompression_throughput"] > 0
+    decoded.save(str(tmp_path / "results.json"))
+
+
+def test_parallel_benchmark_order_and_pinning():
+    test = Test()
+    zlib = buffer_codec("zlib")
+    parent = os.getpid()
+
+    def save(image, target):
+        # Pinned workers run on a single CPU.
+        assert os.getpid() == parent or len(os.sched_getaffinity(0)) == 1
+        zlib["save"](image, target)
+
+    test.set_model("zlib", **dict(zlib, save=save))
+    test.set_model("bz2", **buffer_codec("bz2"))
+    serial = test.benchmark(6, plot=False, pin_cpus=False)
+    order = []
+    parallel = test.benchmark(6, plot=False, workers=2, pin_cpus=True,
+                              callback=lambda record: order.append((record["name"], record["index"])))
+    assert order == [(name, index) for name in ("zlib", "bz2") for index in range(6)]
+    assert (parallel.records["bytes"] == serial.records["bytes"]).all()
+    assert parallel.records["match"].all()
+
+
+def test_checkpoint_resume(tmp_path):
+    test = Test()
+    zlib = buffer_codec("zlib")
+    saved = []
+    interrupt = [True]
+
+    def save(image, target):
+        if interrupt[0] and len(saved) == 3:
+            raise KeyboardInterrupt
+        saved.append(image)
+        zlib["save"](image, target)
+
+    test.set_model("zlib", **dict(zlib, save=save))
+    checkpoint = str(tmp_path / "checkpoint.npz")
+    with pytest.raises(KeyboardInterrupt):
+        test.benchmark(5, plot=False, checkpoint=checkpoint)
+    interrupt[0] = False
+    saved.clear()
+    results = test.benchmark(5, plot=False, checkpoint=checkpoint, resume=True)
+    # Only the 2 images left by the interrupted run are compressed.
+    assert len(saved) == 2
+    assert results.records["done"].all() and results.records["match"].all()
+    assert (results.records["pixels"] == 25 * 10).all()
+
+
+def test_artifact_store_lru_eviction(tmp_path):
+    with ArtifactStore(str(tmp_path / "store"), max_bytes=250) as store:
+        store.put("model", "1", "a", io.BytesIO(bytes(100)))
+        store.put("model", "1", "b", io.BytesIO(bytes(100)))
+        # Using a makes b the least recently used artifact, so it is evicted first.
+        store.find("model", "1", "a")
+        store.put("model", "1", "c", io.BytesIO(bytes(100)))
+        assert store.size() == 200
+        store.find("model", "1", "a")
+        store.find("model", "1", "c")
+        with pytest.raises(FileNotFoundError):
+            store.find("model", "1", "b")
+
+    test = Test()
+    test.set_model("zlib", **buffer_codec("zlib"))
+    directory = str(tmp_path / "artifacts")
+    encoded = test.benchmark(3, plot=False, store=directory)
+    for workers in (None, 2):
+        decoded = test.benchmark(3, plot=False, store=directory, decode_only=True, workers=workers)
+        assert (decoded.records["bytes"] == encoded.records["bytes"]).all() and decoded.records["match"].all()
+
+
+def test_tiled_dataset_aggregate():
+    images = [np.random.randint(0, 4, shape, dtype=np.uint8) for shape in ((20, 18, 3), (9, 30, 3))]
+
+    class TiledTest(LCB):
+        def prepare_dataset(self):
+            return TiledDataset(images, (8, 10), overlap=2)
+
+    test = TiledTest()
+    tiles = test.dataset
+    # Rows start at 0, 6 and 12 and columns at 0 and 8 for the first image, 0 and 6 by 0, 8, 16 and 24 for the second.
+    assert len(tiles) == 6 + 8
+    assert tiles.format(5) == ((8, 10, 3), np.dtype(np.uint8))
+    assert tiles.format(13) == ((3, 6, 3), np.dtype(np.uint8))
+    test.set_model("zlib", **buffer_codec("zlib"))
+    results = test.benchmark(len(tiles), plot=False)
+    aggregated = tiles.aggregate(results)
+    assert aggregated.num_images == 2
+    assert list(aggregated.records["pixels"]) == [image.size for image in images]
+    assert list(aggregated.records["bytes"]) == [results.records["bytes"][:6].sum(), results.records["bytes"][6:].sum()]
+    assert aggregated.records["match"].all()
+    # Images whose tiles weren't all benchmarked are left out.
+    assert tiles.aggregate(test.benchmark(len(tiles) - 1, plot=False)).num_images == 1
+    # Mismatches that weren't counted, e.g. in hash mode, stay uncounted.
+    test.set_model("zlib", **dict(buffer_codec("zlib"), load=lambda path: np.zeros(1)))
+    with pytest.warns(UserWarning):
+        aggregated = tiles.aggregate(test.benchmark(len(tiles), plot=False, verify="hash"))
+    assert not aggregated.records["match"].any() and (aggregated.records["mismatches"] == -1).all()
+
+
+def test_iter_benchmark():
+    test = Test()
+    test.set_model("zlib", **buffer_codec("zlib"))
+    # The options are checked before the generator runs.
+    with pytest.raises(ValueError):
+        test.iter_benchmark(3, repeats=0)
+    records, results = test.iter_benchmark(3)
+    assert [record["index"] for record in records] == [0, 1, 2]
+    assert results.records["done"].all() and results.records["match"].all()
+
+
+def test_summary_of_partial_run():
+    test = Test()
+    test.set_model("zlib", **buffer_codec("zlib"))
+    full = test.benchmark(4, plot=False)
+    records, results = test.iter_benchmark(4)
+    assert results.summary()["zlib"]["bpsp"] is None
+    next(records)
+    records.close()
+    # Only the finished image is aggregated, not the rows that were never run.
+    summary = results.summary()["zlib"]
+    assert summary["bpsp"] == full.bpsp("zlib")[0]
+    assert np.isfinite(summary["compression_throughput"]) and np.isfinite(summary["compression_throughput_ci"]).all()
+    assert len(results.percentiles("zlib", "bpsp")) == 5
+
+
+def test_command_line(tmp_path, monkeypatch):
+    directory = tmp_path / "config"
+    directory.mkdir()
+    for index in range(4):
+        np.save(str(directory / "image{}.npy".format(index)), np.full((6, 5, 3), index, dtype=np.uint8))
+    config = {"dataset": {"type": "npy", "paths": ["image*.npy"], "start": 1},
+              "benchmark": {"cache": "results.db", "output": "results.csv"},
+              "models": {"zlib": {"adapter": "zlib", "options": {"level": 9}}}}
+    with open(str(directory / "config.json"), "w") as fo:
+        json.dump(config, fo)
+    # Relative paths are resolved from the config file, not from the working directory.
+    monkeypatch.chdir(tmp_path)
+    main(["run", "config/config.json"])
+    with open(str(directory / "results.csv")) as fo:
+        rows = list(csv.DictReader(fo))
+    assert [(row["model"], row["image"], row["match"]) for row in rows] == [("zlib", str(index), "True")
+                                                                             for index in range(3)]
+    assert all(int(row["pixels"]) == 6 * 5 * 3 for row in rows)
+    assert os.path.exists(str(directory / "results.db"))
+    main(["run", str(directory / "config.json"), "--output", str(tmp_path / "override.csv")])
+    assert os.path.exists(str(tmp_path / "override.csv"))
+
+
+@pytest.mark.skipif(not RESETTABLE_PEAK_RSS, reason="the peak RSS can't be reset on this system")
+def test_peak_rss_per_image():
+    test = Test()
+    zlib = buffer_codec("zlib")
+
+    def save(image, target):
+        # Every image needs the same 64MB at its peak, not only the first one.
+        np.ones(8 << 20).sum()
+        zlib["save"](image, target)
+
+    test.set_model("zlib", **dict(zlib, save=save))
+    results = test.benchmark(4, plot=False)
+    assert (results.records["encode_rss_bytes"] > 32 << 20).all()
+    assert (results.records["decode_rss_bytes"] < 32 << 20).all()
+
+
+def test_warmup_and_repeats():
+    test = Test()
+    zlib = buffer_codec("zlib")
+    loads = []
+
+    def load(target):
+        loads.append(target)
+        return zlib["load"](target)
+
+    calls = iter(range(1, 100))
+    # The codec timer counts its calls, so the median of the kept runs tells which ones were dropped.
+    test.set_model("zlib", **dict(zlib, load=load, codec_timer=lambda: next(calls)))
+    results = test.benchmark(3, plot=False, warmup=2, repeats=3)
+    assert len(loads) == 3 * (2 + 3)
+    records = results.records
+    # The first image is compressed in calls 1 to 5 and decompressed in calls 6 to 10, the warmup runs are dropped.
+    assert (records["encode_codec_ns"][0], records["decode_codec_ns"][0]) == (4, 9)
+    assert (records["encode_min_ns"] <= records["encode_ns"]).all()
+    assert (records["decode_min_ns"] <= records["decode_mean_ns"]).all()
+    assert (records["encode_std_ns"] >= 0).all() and (records["decode_std_ns"] > 0).any()
+
+
+def test_bootstrap_ci_chunks():
+    values = np.random.default_rng(1).random(1000)
+    # Drawing the resamples in chunks gives the same interval as drawing them at once.
+    assert bootstrap_ci(values, chunk_size=values.size * 7) == bootstrap_ci(values, chunk_size=values.size * 1000)
+    low, high = bootstrap_ci(values, chunk_size=1)
+    assert low < values.mean() < high
+
+
+def test_parallel_platform_checks(monkeypatch):
+    test = Test()
+    test.set_model("zlib", **buffer_codec("zlib"))
+    monkeypatch.delattr(os, "sched_setaffinity")
+    with pytest.warns(UserWarning, match="pin"):
+        results = test.benchmark(2, plot=False, workers=2, pin_cpus=True)
+    assert results.records["match"].all()
+    monkeypatch.setattr(multiprocessing, "get_all_start_methods", lambda: ["spawn"])
+    with pytest.raises(ValueError, match="fork"):
+        test.iter_benchmark(2, workers=2)
+
+
+def test_pil_codec_round_trip():
+    pytest.importorskip("PIL")
+    rng = np.random.default_rng(0)
+    images = [rng.integers(0, 256, (12, 10, 3), dtype=np.uint8), rng.integers(0, 256, (12, 10, 4), dtype=np.uint8),
+              rng.integers(0, 256, (12, 10, 1), dtype=np.uint8), rng.integers(0, 1 << 16, (12, 10), dtype=np.uint16)]
+
+    class PilTest(LCB):
+        def prepare_dataset(self):
+            return images
+
+    test = PilTest()
+    for image_format in ("png", "tiff"):
+        test.set_model(image_format, **adapter(image_format))
+    test.set_model("webp", **adapter("webp"))
+    with pytest.warns(UserWarning):
+        results = test.benchmark(4, plot=False, in_memory=True)
+    assert results.model_records("png")["match"].all() and results.model_records("tiff")["match"].all()
+    # WebP only stores 8-bit RGB and RGBA images.
+    assert list(results.model_records("webp")["match"]) == [True, True, False, False]
+
+
+def batch_model(timer=None):
+    def model_batch(images):
+        return [zlib.compress(np.ascontiguousarray(image).tobytes()) for image in images]
+
+    def save(compressed, path):
+        with open(path, "wb") as fo:
+            fo.write(compressed)
+
+    def load(path):
+        with open(path, "rb") as fo:
+            return np.frombuffer(zlib.decompress(fo.read())).reshape(25, 10)
+
+    return {"model": None, "preprocess": lambda image: image, "save": save, "load": load, "compare": None,
+            "model_batch": model_batch, "batch_size": 2, "codec_timer": timer}
+
+
+def test_batched_model():
+    test = Test()
+    test.set_model("batch", **batch_model())
+    for workers in (None, 2):
+        records = test.benchmark(5, plot=False, workers=workers).records
+        assert records["match"].all()
+        assert list(records["batch_size"]) == [2, 2, 2, 2, 1]
+        # The batch time is apportioned to its images by their subpixels, which are the same here.
+        for start in (0, 2):
+            batch = records[start:start + 2]
+            assert batch["batch_ns"][0] == batch["batch_ns"][1]
+            assert batch["encode_ns"].sum() == pytest.approx(batch["batch_ns"][0])
+        assert records["batch_ns"][4] == records["encode_ns"][4]
+
+
+def test_codec_timer():
+    test = Test()
+    test.set_model("batch", **batch_model(lambda: 1000))
+    test.set_model("silent", **dict(batch_model(lambda: None), batch_size=1))
+    results = test.benchmark(5, plot=False)
+    batch = results.model_records("batch")
+    # The codec time of a batch is split like its wall time, and every decompression reports its own.
+    assert list(batch["encode_codec_ns"]) == [500, 500, 500, 500, 1000]
+    assert (batch["decode_codec_ns"] == 1000).all()
+    silent = results.model_records("silent")
+    assert (silent["encode_codec_ns"] == -1).all() and (silent["decode_codec_ns"] == -1).all()
+
+
+def test_scaling_sweep():
+    test = Test()
+    test.set_model("npy", **buffer_codec("zlib"))
+    counts = []
+
+    def factory(threads):
+        counts.append(threads)
+        return buffer_codec("zlib", level=threads)
+
+    scaling = test.scaling_sweep("zlib", factory, [4, 1, 2, 2], 3, plot=False)
+    # The registered models are restored, and the thread counts are swept once each, in order.
+    assert list(test.models) == ["npy"]
+    assert scaling.threads == [1, 2, 4] and sorted(counts) == [1, 2, 4]
+    assert scaling.results.models == ["zlib (1 threads)", "zlib (2 threads)", "zlib (4 threads)"]
+    throughput = scaling.throughput()
+    assert np.allclose(scaling.speedup(), throughput / throughput[0])
+    assert np.allclose(scaling.efficiency(), scaling.speedup() / np.array([1, 2, 4]))
+
+
+def test_bit_depth():
+    images = [np.random.default_rng(index).integers(0, 1 << 12, (16, 16), dtype=np.uint16) for index in range(2)]
+
+    class DepthTest(LCB):
+        def prepare_dataset(self):
+            return images
+
+    test = DepthTest()
+    test.set_model("zlib", **buffer_codec("zlib"))
+    results = test.benchmark(2, plot=False, bit_depth=12)
+    records = results.records
+    assert (records["bit_depth"] == 12).all()
+    assert np.allclose(results.compression_ratio("zlib"), 16 * 16 * 12 / (records["bytes"] * 8))
+    with pytest.raises(ValueError):
+        test.benchmark(2, plot=False, bit_depth=17)
+
+
+def test_memmap_dataset(tmp_path):
+    stack = np.arange(3 * 4 * 5 * 2, dtype=np.uint16).reshape(3, 4, 5, 2)
+    raw = str(tmp_path / "stack.raw")
+    with open(raw, "wb") as fo:
+        fo.write(bytes(16))
+        fo.write(stack.tobytes())
+    np.save(str(tmp_path / "stack.npy"), stack)
+    for dataset in (MemmapDataset(raw, (4, 5, 2), np.uint16, offset=16), MemmapDataset(str(tmp_path / "stack.npy"))):
+        assert len(dataset) == 3
+        assert np.array_equal(dataset[1], stack[1])
+        # Images are views of the memory-mapped stack, not copies.
+        assert np.shares_memory(dataset[1], dataset.stack)
+        assert dataset.format(2) == ((4, 5, 2), np.dtype(np.uint16))
+
+        class MemmapTest(LCB):
+            def prepare_dataset(self):
+                return dataset
+
+        test = MemmapTest()
+        assert test.lens == [4 * 5 * 2] * 3
+        test.set_model("zlib", **buffer_codec("zlib"))
+        assert test.benchmark(3, plot=False).records["match"].all()